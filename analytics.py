@@ -0,0 +1,98 @@
+"""Service-level analytics: time to resolution and rating distributions.
+
+Rows are selected as plain columns (no ORM objects) into pandas DataFrames,
+and every breakdown is a single grouped, vectorized operation over them:
+groupby().quantile() for the percentiles and crosstab() for the histograms.
+
+Resolution time is measured from zayavka.created_at to the first status_change
+into a resolved status, so only transitions recorded since status history was
+introduced are counted.
+"""
+import numpy as np
+import pandas as pd
+
+from models import db, Zayavka, StatusChange
+
+RESOLVED_STATUSES = ('сделано', 'отклонено')
+PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+RATINGS = [1, 2, 3, 4, 5]
+BREAKDOWNS = ('type', 'faculty')
+
+def frame(query):
+    result = db.session.execute(query)
+    return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+def in_range(query, start, end):
+    if start:
+        query = query.where(Zayavka.created_at >= start)
+    if end:
+        query = query.where(Zayavka.created_at < end)
+    return query
+
+def resolution_frame(start=None, end=None):
+    # One row per resolved request: type, faculty and hours until its first resolution
+    query = db.select(
+        Zayavka.type, db.func.coalesce(Zayavka.faculty, '').label('faculty'), Zayavka.created_at,
+        db.func.min(StatusChange.changed_at).label('resolved_at')
+    ).join(StatusChange, StatusChange.zayavka_id == Zayavka.id) \
+        .where(StatusChange.new_status.in_(RESOLVED_STATUSES)) \
+        .group_by(Zayavka.id)
+    data = frame(in_range(query, start, end))
+    elapsed = pd.to_datetime(data['resolved_at']) - pd.to_datetime(data['created_at'])
+    data['hours'] = elapsed.dt.total_seconds() / 3600
+    return data
+
+def ratings_frame(start=None, end=None):
+    query = db.select(Zayavka.type, db.func.coalesce(Zayavka.faculty, '').label('faculty'), Zayavka.rating) \
+        .where(Zayavka.rating.between(RATINGS[0], RATINGS[-1]))
+    return frame(in_range(query, start, end))
+
+def rounded(value):
+    return None if pd.isna(value) else round(float(value), 2)
+
+def percentiles(hours):
+    values = hours.quantile(list(PERCENTILES.values())).tolist() if len(hours) else [None] * len(PERCENTILES)
+    return {'count': int(len(hours)), **{name: rounded(value) for name, value in zip(PERCENTILES, values)}}
+
+def percentiles_by(data, column):
+    if data.empty:
+        return []
+    grouped = data.groupby(column)['hours']
+    table = grouped.quantile(list(PERCENTILES.values())).unstack()
+    table.columns = list(PERCENTILES)
+    table['count'] = grouped.size()
+    return [
+        {column: key, 'count': int(row['count']), **{name: rounded(row[name]) for name in PERCENTILES}}
+        for key, row in table.sort_values('count', ascending=False).iterrows()
+    ]
+
+def histogram(ratings):
+    counts = np.bincount(ratings.to_numpy(dtype=np.int64), minlength=RATINGS[-1] + 1)[RATINGS[0]:]
+    return {'histogram': counts.tolist(), 'average': rounded(ratings.mean()), 'count': int(counts.sum())}
+
+def histogram_by(data, column):
+    if data.empty:
+        return []
+    table = pd.crosstab(data[column], data['rating']).reindex(columns=RATINGS, fill_value=0)
+    averages = data.groupby(column)['rating'].mean()
+    return [
+        {column: key, 'histogram': [int(count) for count in row], 'average': rounded(averages[key]),
+         'count': int(row.sum())}
+        for key, row in table.iterrows()
+    ]
+
+def summary(start=None, end=None):
+    """Percentiles (hours) and rating histograms, overall and by type and faculty."""
+    resolution = resolution_frame(start, end)
+    ratings = ratings_frame(start, end)
+    return {
+        'resolution_hours': {
+            'overall': percentiles(resolution['hours']),
+            **{f'by_{column}': percentiles_by(resolution, column) for column in BREAKDOWNS},
+        },
+        'ratings': {
+            'scale': RATINGS,
+            'overall': histogram(ratings['rating']),
+            **{f'by_{column}': histogram_by(ratings, column) for column in BREAKDOWNS},
+        },
+    }
@@ -1,32 +1,89 @@
 import logging
-from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, send_file
+import click
+from flask.cli import AppGroup
+from flask import Flask, render_template, request, redirect, url_for, session, send_file, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import event
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from authlib.integrations.flask_client import OAuth  # Import Authlib for OAuth
 from collections import Counter
 import os
 import datetime
-import pandas as pd
-import io
-import secrets  # Import for generating nonce
-import openpyxl  # Import for Excel handling
+import json
 import tempfile
-import shutil
+import time
+import threading
+import secrets  # Import for generating nonce
 from functools import wraps
 from flask_frozen import Freezer  # Исправлено на flask_frozen
 
-from models import db, User, Zayavka
-from utils import generate_word_report, generate_pdf_report
+from models import db, User, Zayavka, DataVersion, ChangeEvent, StatusChange, RequestCounter, RequestRollup, ReportJob
+import queries
+import exports
+import archive
+import report_cache
+import report_jobs
+import storage
+import media
+import upload_pipeline
+import upload_gc
+from queries import paginate, paginate_ranked
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
 app = Flask(__name__)
+app.request_class = storage.UploadRequest  # File parts go straight to UPLOAD_FOLDER/tmp, hashed on the way
 app.secret_key = 'supersecretkey'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///database.db')
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Server-Sent Events (/stream/requests)
+app.config['SSE_POLL_INTERVAL'] = 1.0  # Seconds between change_event polls per open stream
+app.config['SSE_HEARTBEAT_INTERVAL'] = 15  # Keep-alive comment so proxies don't drop idle streams
+app.config['SSE_MAX_STREAM_SECONDS'] = 300  # Streams end periodically; EventSource resumes via Last-Event-ID
+# Each open stream holds a gunicorn thread; keep this well below GUNICORN_THREADS (Procfile)
+# so ordinary requests always find a free one. Streams over the cap are told to retry later.
+app.config['SSE_MAX_STREAMS_PER_WORKER'] = 16
+app.config['SSE_OVERFLOW_RETRY_MS'] = 30000
+app.config['CHANGE_LOG_RETENTION_HOURS'] = 24
+app.config['PAGE_SIZE'] = 30  # Cards per page on /admin, /history and /my-requests
+# Background reports (report_jobs.py)
+app.config['REPORTS_FOLDER'] = 'reports'
+app.config['REPORT_WORKERS'] = 2  # Threads per gunicorn worker that build reports
+app.config['REPORT_JOB_STALE_SECONDS'] = 900  # A running job without progress this long: its worker died
+app.config['REPORT_JOB_QUEUED_TIMEOUT_SECONDS'] = 6 * 3600  # Backstop for owners on another host (None: never)
+app.config['REPORT_JOB_RETENTION_HOURS'] = 24
+app.config['REPORT_CACHE_FOLDER'] = os.path.join(app.config['REPORTS_FOLDER'], 'cache')
+app.config['REPORT_CACHE_MAX_BYTES'] = 500 * 1024 * 1024  # Least recently downloaded reports go first
+# Excel archives of closed requests (archive.py), in UPLOAD_FOLDER
+app.config['ARCHIVE_FILES'] = {'сделано': 'завершённые_заявки.xlsx', 'отклонено': 'отклонённые_заявки.xlsx'}
+# Serving /uploads (storage.response); content-addressed names are cached for a year
+app.config['UPLOADS_MAX_AGE'] = 3600  # Legacy flat names can be overwritten, so they get a short max-age
+app.config['UPLOADS_SENDFILE'] = os.getenv('UPLOADS_SENDFILE')  # None, 'x-sendfile' or 'x-accel-redirect'
+app.config['UPLOADS_ACCEL_PREFIX'] = os.getenv('UPLOADS_ACCEL_PREFIX', '/protected-uploads/')  # nginx internal location
+# Uploads (storage.py, upload_pipeline.py). Bodies over the limit are refused with 413,
+# up front when Content-Length says so, otherwise as soon as the limit is read.
+app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024
+app.config['UPLOAD_LIMITS'] = {  # Per endpoint, below MAX_CONTENT_LENGTH
+    'send': 20 * 1024 * 1024,
+    'register': 5 * 1024 * 1024,
+    'profile': 5 * 1024 * 1024,
+    'edit_profile': 5 * 1024 * 1024,
+}
+app.config['UPLOAD_WORKERS'] = 2  # Threads per gunicorn worker for virus scans and thumbnails
+# e.g. "clamdscan --no-summary --fdpass"; exit status 1 means infected
+app.config['UPLOAD_SCANNER'] = upload_pipeline.command_scanner(os.environ['UPLOAD_SCAN_COMMAND']) \
+    if os.getenv('UPLOAD_SCAN_COMMAND') else None
+app.config['UPLOAD_QUARANTINE_FOLDER'] = 'quarantine'
+app.config['UPLOAD_GC_GRACE_HOURS'] = 24  # `flask uploads gc` leaves younger files alone
+app.config['UPLOAD_GC_INTERVAL_HOURS'] = None  # Also collect from the upload pool this often (None: cron only)
+# Image variants (media.py)
+app.config['MEDIA_FOLDER'] = 'media'
+app.config['MEDIA_CACHE_MAX_BYTES'] = 200 * 1024 * 1024
+# /export/requests.csv and .ndjson also accept "Authorization: Bearer <token>" when this is set
+app.config['EXPORT_API_TOKEN'] = os.getenv('EXPORT_API_TOKEN')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Set logging level after app is created
@@ -34,6 +91,17 @@ app.logger.setLevel(logging.INFO)
 
 db.init_app(app)
 migrate = Migrate(app, db)
+app.jinja_env.globals['media_url'] = media.url
+
+def configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets long streaming reads (exports, report jobs) run while requests keep writing
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', configure_sqlite)
 
 # Configure OAuth
 import os
@@ -70,6 +138,33 @@ def role_required(role):
         return decorated_function
     return wrapper
 
+@app.before_request
+def limit_upload_size():
+    limit = app.config['UPLOAD_LIMITS'].get(request.endpoint)
+    if limit is None:
+        return
+    request.max_content_length = limit  # Enforced while the body is read, even when chunked
+    if request.content_length and request.content_length > limit:
+        raise RequestEntityTooLarge()  # Refused before a byte of the body is read
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    limit = request.max_content_length or app.config['MAX_CONTENT_LENGTH']
+    return f"Файл слишком большой: не более {limit // (1024 * 1024)} МБ", 413
+
+def render_cards(cards_template, zayavki, next_cursor):
+    # Card markup only; the cursor for the next page travels in a header
+    response = app.make_response(render_template(cards_template, zayavki=zayavki))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def render_page(template, cards_template, zayavki, next_cursor):
+    # "Load more" requests get only the card markup
+    if request.args.get('partial'):
+        return render_cards(cards_template, zayavki, next_cursor)
+    return render_template(template, zayavki=zayavki, next_cursor=next_cursor)
+
 @app.route('/login/google')
 def login_google():
     # Generate a nonce and store it in the session
@@ -178,8 +273,7 @@ def register():
     photo = request.files.get('photo')
     photo_filename = None
     if photo and photo.filename != '':
-        photo_filename = secure_filename(photo.filename)
-        photo.save(os.path.join(app.config['UPLOAD_FOLDER'], photo_filename))
+        photo_filename = storage.store(photo)
 
     user = User(
         username=username,
@@ -194,6 +288,7 @@ def register():
     db.session.add(user)
     try:
         db.session.commit()
+        upload_pipeline.schedule(photo_filename)
         session['user_id'] = user.id
         session['role'] = user.role
         return redirect(url_for('employee') if role == 'employee' else url_for('admin'))
@@ -224,14 +319,14 @@ def logout():
 @app.route('/employee')
 @role_required('employee')
 def employee():
-    zayavki = Zayavka.query.filter_by(user_id=session['user_id']).order_by(Zayavka.created_at.desc()).all()
-    return render_template('employee.html', zayavki=zayavki)
+    # The form page doesn't list requests; they live on /my-requests
+    return render_template('employee.html')
 
 @app.route('/my-requests')
 @role_required('employee')
 def my_requests():
-    zayavki = Zayavka.query.filter_by(user_id=session['user_id']).order_by(Zayavka.created_at.desc()).all()
-    return render_template('my_requests.html', zayavki=zayavki)
+    zayavki, next_cursor = paginate(queries.user_requests(session['user_id']))
+    return render_page('my_requests.html', 'my_requests_cards.html', zayavki, next_cursor)
 
 @app.route('/send', methods=['POST'])
 @role_required('employee')
@@ -239,8 +334,7 @@ def send():
     file = request.files.get('file')
     filename = None
     if file and file.filename != '':
-        filename = secrets.token_hex(8) + '_' + secure_filename(file.filename)
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        filename = storage.store(file)
 
     urgent = bool(request.form.get('urgent'))  # Check if the "Срочно" checkbox is selected
 
@@ -249,49 +343,131 @@ def send():
         description=request.form['description'],
         user_id=session['user_id'],
         file=filename,
-        urgent=urgent  # Save the urgent status
+        file_name=storage.original_name(file.filename) if filename else None,
+        urgent=urgent,  # Save the urgent status
+        faculty=db.session.get(User, session['user_id']).faculty  # Kept as is when the profile changes
     )
     db.session.add(z)
+    record_change('created', z)
+    RequestCounter.track(z, 1)
+    RequestRollup.track(z, 1)
+    db.session.add(StatusChange(zayavka_id=z.id, new_status=z.status, changed_by=z.user_id))
     db.session.commit()
+    upload_pipeline.schedule(filename)
     return redirect(url_for('employee'))
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return storage.response(filename)
+
+@app.route('/media/<sha256>/<size>')
+def media_variant(sha256, size):
+    # Resized images for <img> tags; the original stays at /uploads/<name>
+    if size not in media.SIZES or storage.content_hash(sha256) != sha256:
+        return jsonify({'error': 'Не найдено'}), 404
+    return media.response(sha256, size)
 
 @app.route('/history')
 @role_required('admin')
 def history():
-    zayavki = Zayavka.query.filter_by(status='сделано').order_by(Zayavka.created_at.desc()).all()
-    return render_template('history.html', zayavki=zayavki)
+    zayavki, next_cursor = paginate(queries.completed_requests())
+    return render_page('history.html', 'history_cards.html', zayavki, next_cursor)
 
 @app.route('/admin')
 @role_required('admin')
 def admin():
-    type_filter = request.args.get('type', '').strip().lower()
+    zayavki, next_cursor = admin_listing()
+    if request.args.get('partial'):
+        return render_cards('admin_cards.html', zayavki, next_cursor)
+    return render_template('admin.html', zayavki=zayavki, next_cursor=next_cursor,
+                           counters=RequestCounter.snapshot())
+
+def admin_listing():
+    # Shared by /admin and /api/requests: type/status/query filters, one keyset page
+    type_filter = request.args.get('type', '').strip()
     status_filter = request.args.get('status', '').strip().lower()
     query_filter = request.args.get('query', '').strip().lower()
 
-    query = Zayavka.query.join(User, Zayavka.user_id == User.id)
+    # "Сделано" is excluded unless requested explicitly
+    query = queries.admin_queue(type_filter, status_filter)
+    rank = None
+    if query_filter:
+        # Ranked full-text search (FTS5) when available, LIKE otherwise
+        query, rank = queries.search(query, query_filter)
 
-    # Exclude "Сделано" by default
-    if not status_filter or status_filter != 'сделано':
-        query = query.filter(Zayavka.status != 'сделано')
+    return paginate_ranked(query, rank) if rank is not None else paginate(query)
 
-    # Apply filters based on type, status, and query
-    if type_filter:
-        query = query.filter(Zayavka.type.ilike(f"%{type_filter}%"))
-    if status_filter:
-        query = query.filter(Zayavka.status.ilike(f"%{status_filter}%"))
-    if query_filter:
-        query = query.filter(
-            (Zayavka.description.ilike(f"%{query_filter}%")) |
-            (User.username.ilike(f"%{query_filter}%")) |
-            (User.full_name.ilike(f"%{query_filter}%"))
-        )
+@app.route('/api/requests')
+@role_required('admin')
+def api_requests():
+    # Same filters as /admin; ?format=html returns card markup for the admin page
+    zayavki, next_cursor = admin_listing()
+    if request.args.get('format') == 'html':
+        return render_cards('admin_cards.html', zayavki, next_cursor)
+    return jsonify({
+        'items': [request_json(z) for z in zayavki],
+        'next_cursor': next_cursor
+    })
+
+def parse_stats_bound(value, period, upper=False):
+    # "2025", "2025-04" or "2025-04-17"; month buckets are always the 1st. An upper
+    # bound given as a year or month covers all of it: "2025" ends on 2025-12-31.
+    if not value:
+        return None
+    try:
+        day = datetime.date.fromisoformat({4: value + '-01-01', 7: value + '-01'}.get(len(value), value))
+    except ValueError:
+        raise ValueError(f'Неверная дата: {value}')
+    if upper and len(value) == 4:
+        day = day.replace(month=12, day=31)
+    elif upper and len(value) == 7:
+        day = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+    return day.replace(day=1) if period == 'month' else day
+
+@app.route('/api/stats')
+@role_required('admin')
+def api_stats():
+    """Counts and average rating per day or month, read from request_rollup only.
+
+    ?period=month|day&from=2023-01&to=2025-12&group_by=type,faculty plus optional
+    exact filters type=, status=, faculty=, urgent=0|1.
+    """
+    period = request.args.get('period', 'month')
+    group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+    if period not in ('day', 'month') or any(name not in queries.STATS_DIMENSIONS for name in group_by):
+        return jsonify({'error': 'Неверные параметры'}), 400
+    try:
+        start = parse_stats_bound(request.args.get('from'), period)
+        end = parse_stats_bound(request.args.get('to'), period, upper=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filters = {name: request.args[name] for name in queries.STATS_DIMENSIONS if name in request.args}
+    if 'urgent' in filters:
+        filters['urgent'] = filters['urgent'] in ('1', 'true')
+
+    items = []
+    for row in queries.stats(period, start, end, group_by, filters):
+        bucket, *dimensions, count, rating_sum, rating_count = row
+        item = {'bucket': bucket.isoformat(), 'count': count,
+                'avg_rating': round(rating_sum / rating_count, 2) if rating_count else None}
+        item.update(zip(group_by, dimensions))
+        items.append(item)
+    return jsonify({'period': period, 'group_by': group_by, 'items': items})
+
+@app.route('/api/analytics')
+@role_required('admin')
+def api_analytics():
+    """Resolution-time percentiles and rating histograms; ?from=&to= bound created_at (inclusive days)."""
+    import analytics  # Pulls in pandas, so workers only load it once someone asks
 
-    zayavki = query.order_by(Zayavka.created_at.desc()).all()
-    return render_template('admin.html', zayavki=zayavki)
+    try:
+        start = parse_stats_bound(request.args.get('from'), 'day')
+        end = parse_stats_bound(request.args.get('to'), 'day', upper=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if end:
+        end += datetime.timedelta(days=1)
+    return jsonify(analytics.summary(start, end))
 
 @app.route('/admin/requests')
 @role_required('admin')
@@ -320,122 +496,149 @@ def admin_calendar():
 @app.route('/calendar')
 @role_required('admin')
 def calendar():
-    zayavki = Zayavka.query.order_by(Zayavka.created_at.desc()).all()
-    return render_template('admin_calendar.html', zayavki=zayavki)
+    # Events are loaded per visible range from /api/calendar_events
+    return render_template('admin_calendar.html')
 
 @app.route('/update_status', methods=['POST'])
 @role_required('admin')
 def update_status():
     z = Zayavka.query.get(request.form['id'])
     new_status = request.form['action'].lower()  # Normalize status to lowercase
-    z.set_status(new_status)  # Use the set_status method to enforce lowercase
+    old_status = z.status
+    z.set_status(new_status, changed_by=session.get('user_id'))  # Use the set_status method to enforce lowercase
+    record_change('status', z)
+    if z.status != old_status and z.status in app.config['ARCHIVE_FILES']:
+        save_to_excel(z, app.config['ARCHIVE_FILES'][z.status])
     db.session.commit()
+    if request.headers.get('X-Requested-With') == 'fetch':
+        # Status buttons on /admin post in the background and patch the card from this reply
+        return jsonify({'id': z.id, 'status': z.status})
     return redirect(url_for('admin'))
 
 def save_to_excel(zayavka, filename):
-    original_filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as temp_file:
-        temp_filepath = temp_file.name
+    # Constant time: the row goes to the archive log and lands in the xlsx on the next compaction
+    archive.append(zayavka, filename)
 
-    try:
-        # Open or create the workbook
-        if os.path.exists(original_filepath):
-            try:
-                workbook = openpyxl.load_workbook(original_filepath)
-            except Exception as e:
-                app.logger.error(f"Error loading Excel file: {e}")
-                return "Ошибка: Файл Excel повреждён или недействителен."
-        else:
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            sheet.title = "Заявки"
-            # Add headers
-            sheet.append(["Тип заявки", "Описание", "Дата", "Статус", "Файл", "Кто оставил заявку", "Факультет"])
-
-        # Open the active sheet
-        sheet = workbook.active
-
-        # Append the new row
-        sheet.append([
-            zayavka.type,
-            zayavka.description,
-            zayavka.created_at.strftime('%d.%m.%Y %H:%M'),
-            zayavka.status,
-            zayavka.file if zayavka.file else "Нет файла",
-            zayavka.user.username,
-            zayavka.user.faculty
-        ])
-
-        # Save the workbook to the temporary file
-        workbook.save(temp_filepath)
-        workbook.close()  # Ensure the workbook is closed before replacing the original file
-
-        # Replace the original file with the temporary file
-        shutil.move(temp_filepath, original_filepath)
-        app.logger.info(f"Excel file updated: {original_filepath}")
-
-    except Exception as e:
-        app.logger.error(f"Error saving to Excel file {filename}: {e}")
-        # Clean up the temporary file in case of an error
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
-        raise
+@app.route('/archive/<status>')
+@role_required('admin')
+def download_archive(status):
+    filename = app.config['ARCHIVE_FILES'].get(status)
+    if not filename:
+        return redirect(url_for('reports'))
+    archive.compact(filename)
+    path = archive.archive_path(filename)
+    if not os.path.exists(path):
+        return redirect(url_for('reports'))
+    return send_file(os.path.abspath(path), download_name=filename, as_attachment=True)
+
+def report_params(form):
+    # (month, format, year) from the reports form; ValueError with the message for a 400
+    month = form.get('month') or 'all'
+    if month != 'all' and (not month.isdigit() or not 1 <= int(month) <= 12):
+        raise ValueError('Неверный месяц')
+    format = form.get('format') or 'xlsx'
+    if format not in report_jobs.FORMATS:
+        raise ValueError('Неизвестный формат')
+    year = form.get('year')
+    if year:
+        if not year.isdigit() or not 2000 <= int(year) <= datetime.date.today().year + 1:
+            raise ValueError('Неверный год')
+        year = int(year)
+    return month, format, year or None
 
 @app.route('/generate_report', methods=['POST'])
 @role_required('admin')
 def generate_report():
-    month = request.form.get('month', 'all')
-    query = Zayavka.query.join(User, Zayavka.user_id == User.id)
-
-    if month != 'all':
-        month = int(month)
-        start = datetime.date(datetime.datetime.now().year, month, 1)
-        end = datetime.date(datetime.datetime.now().year + (month == 12), (month % 12) + 1, 1)
-        query = query.filter(Zayavka.created_at >= start, Zayavka.created_at < end)
-
-    data = [{
-        'Сотрудник': z.user.username,
-        'Тип': z.type,
-        'Описание': z.description,
-        'Статус': z.status,
-        'Дата': z.created_at.strftime('%Y-%m-%d %H:%M')
-    } for z in query.all()]
-
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    now = datetime.datetime.now()
-
-    if month == 'all':
-        filename = f"Заявки_{now.year}.xlsx"
-    else:
-        month_name = now.strftime('%B')
-        filename = f"Заявки_{month_name}_{now.year}.xlsx"
+    try:
+        month, format, year = report_params(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Served from report_cache, so a month pregenerated overnight costs one version query
+    path, hit = report_jobs.build(format, month, year)
+    app.logger.info(f"Report {format} {month}/{year or 'current'}: {'cache hit' if hit else 'generated'}")
+    return send_file(os.path.abspath(path), download_name=report_jobs.report_filename(month, year, format), as_attachment=True)
+
+@app.route('/reports/jobs', methods=['POST'])
+@role_required('admin')
+def report_job_submit():
+    try:
+        month, format, year = report_params(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    job = report_jobs.submit(session.get('user_id'), month, year, format)
+    return jsonify(report_jobs.job_json(job)), 202
 
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Отчёт')
+@app.route('/reports/jobs/<job_id>')
+@role_required('admin')
+def report_job_status(job_id):
+    job = db.get_or_404(ReportJob, job_id)
+    return jsonify(report_jobs.job_json(job))
 
-    output.seek(0)
-    return send_file(output, download_name=filename, as_attachment=True)
+@app.route('/reports/jobs/<job_id>/download')
+@role_required('admin')
+def report_job_download(job_id):
+    job = db.get_or_404(ReportJob, job_id)
+    if job.status != 'done':
+        return jsonify({'error': 'Отчёт ещё не готов'}), 409
+    if not os.path.exists(job.path):
+        # Evicted from the report cache or replaced by a newer version of the report
+        return jsonify({'error': 'Отчёт устарел, сформируйте его заново'}), 410
+    return send_file(os.path.abspath(job.path), download_name=job.filename, as_attachment=True)
 
 @app.route('/export_requests')
 @role_required('admin')
 def export_requests():
-    zayavki = Zayavka.query.all()
-    data = [{
-        'ID': z.id,
-        'Тип': z.type,
-        'Описание': z.description,
-        'Дата': z.created_at.strftime('%Y-%m-%d %H:%M'),
-        'Пользователь': z.user.full_name if z.user else 'Неизвестно',
-        'Статус': z.status
-    } for z in zayavki]
-
-    df = pd.DataFrame(data)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-        df.to_excel(tmp.name, index=False)
-        return send_file(tmp.name, as_attachment=True, download_name='Заявки.xlsx')
+    # Streamed into a self-deleting spool file; nothing is left behind in /tmp
+    output = exports.requests_xlsx(queries.export_table())
+    return send_file(output, as_attachment=True, download_name='Заявки.xlsx', mimetype=exports.XLSX_MIMETYPE)
+
+def export_authorized():
+    token = app.config['EXPORT_API_TOKEN']
+    header = request.headers.get('Authorization', '')
+    if token and secrets.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    return session.get('role') == 'admin'
+
+def parse_updated_since(value):
+    # ISO 8601 as returned in updated_at; an offset is converted to UTC, which updated_at is stored in
+    if not value:
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Неверная дата: {value}')
+    if moment.tzinfo:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+@app.route('/export/requests.csv', defaults={'format': 'csv'})
+@app.route('/export/requests.ndjson', defaults={'format': 'ndjson'})
+def export_requests_stream(format):
+    """All requests as CSV or NDJSON for integrations, streamed as rows are read.
+
+    ?from=&to= bound created_at (inclusive days), ?status= and ?type= are exact
+    matches. ?updated_since=<updated_at> returns only requests changed since then,
+    oldest change first; deleted requests are not reported.
+    """
+    if not export_authorized():
+        return jsonify({'error': 'Нет доступа'}), 401
+    try:
+        created_from = parse_stats_bound(request.args.get('from'), 'day')
+        created_to = parse_stats_bound(request.args.get('to'), 'day', upper=True)
+        updated_since = parse_updated_since(request.args.get('updated_since'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if created_to:
+        created_to += datetime.timedelta(days=1)
+
+    rows = queries.integration_rows(created_from, created_to, request.args.get('status'),
+                                    request.args.get('type'), updated_since)
+    if format == 'csv':
+        chunks, mimetype = exports.csv_chunks(queries.INTEGRATION_FIELDS, rows), exports.CSV_MIMETYPE
+    else:
+        chunks, mimetype = exports.ndjson_chunks(queries.INTEGRATION_FIELDS, rows), exports.NDJSON_MIMETYPE
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=requests.{format}'})
 
 @app.route('/delete_user/<int:user_id>', methods=['POST'])
 @role_required('admin')
@@ -447,6 +650,8 @@ def delete_user(user_id):
             return {"error": f"User with ID {user_id} not found."}, 404
         db.session.delete(user)
         db.session.commit()
+        # Reports join on user, so their rows drop out without any zayavka change
+        report_cache.clear()
         app.logger.info(f"User with ID {user_id} has been deleted.")
         return {"message": f"User with ID {user_id} has been deleted."}, 200
     except Exception as e:
@@ -465,6 +670,9 @@ def users():
 def delete_request(request_id):
     z = Zayavka.query.get(request_id)
     if z and z.user_id == session['user_id'] and z.status != 'сделано':
+        record_change('deleted', z)
+        RequestCounter.track(z, -1)
+        RequestRollup.track(z, -1)
         db.session.delete(z)
         db.session.commit()
     return redirect(url_for('my_requests'))
@@ -484,12 +692,12 @@ def profile():
         user.position = request.form.get('position')
         # Handle profile photo upload
         photo = request.files.get('photo')
-        if photo and photo.filename != '':
-            photo_filename = secure_filename(photo.filename)
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_filename)
-            photo.save(photo_path)
-            user.photo = photo_filename  # Update the photo field in the database
+        new_photo = bool(photo and photo.filename != '')
+        if new_photo:
+            user.photo = storage.store(photo)  # Update the photo field in the database
         db.session.commit()
+        if new_photo:
+            upload_pipeline.schedule(user.photo)  # Only a new photo needs the scan and variants
         return redirect(url_for('profile'))
     # Render different templates based on the user's role
     return render_template('profile_admin.html', user=user) if user.role == 'admin' else render_template('profile_employee.html', user=user)
@@ -509,12 +717,12 @@ def edit_profile():
         user.position = request.form.get('position')
         # Handle profile photo upload
         photo = request.files.get('photo')
-        if photo and photo.filename != '':
-            photo_filename = secure_filename(photo.filename)
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_filename)
-            photo.save(photo_path)
-            user.photo = photo_filename  # Save the photo filename in the database
+        new_photo = bool(photo and photo.filename != '')
+        if new_photo:
+            user.photo = storage.store(photo)  # Save the photo filename in the database
         db.session.commit()
+        if new_photo:
+            upload_pipeline.schedule(user.photo)  # Only a new photo needs the scan and variants
         return redirect(url_for('profile'))
     return render_template('edit_profile.html', user=user)
 
@@ -557,33 +765,170 @@ def submit_feedback(request_id):
         return redirect(url_for('index'))
     z = Zayavka.query.get(request_id)
     if z and z.user_id == session['user_id'] and z.status in ['сделано', 'отклонено']:
+        before = RequestRollup.facts(z)
         z.comment = request.form.get('comment')
         z.rating = int(request.form.get('rating'))
         z.confirmed_by_user = True
+        RequestRollup.change(before, z)
+        record_change('feedback', z)
         db.session.commit()
     return redirect(url_for('my_requests'))
 
 @app.route('/reports')
 @role_required('admin')  # или убери, если пока не используешь авторизацию
 def reports():
-    return render_template('reports.html')
-
-from flask import jsonify
+    # The previous month is preselected: it is the one `flask reports pregenerate` builds
+    default_month, default_year = report_jobs.previous_month()
+    this_year = datetime.date.today().year
+    return render_template('reports.html', default_month=default_month, default_year=default_year,
+                           years=range(this_year, this_year - 5, -1))
+
+def parse_calendar_bound(value):
+    # FullCalendar sends ISO 8601 bounds, e.g. "2025-04-27T00:00:00+05:00"
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
 
 @app.route('/api/calendar_events')
 def calendar_events():
-    zayavki = Zayavka.query.all()
+    start = parse_calendar_bound(request.args.get('start'))
+    end = parse_calendar_bound(request.args.get('end'))
+
+    # Answer polls with 304 before touching zayavka rows if nothing was written since
+    version, changed_at, max_id = DataVersion.current()
+    etag = f"{max_id}-{version}"
+    not_modified = Response()
+    not_modified.set_etag(etag)
+    not_modified.last_modified = changed_at
+    not_modified.cache_control.no_cache = True
+    if not_modified.make_conditional(request).status_code == 304:
+        return not_modified
+
+    # Only the visible range (uses ix_zayavka_created_at) and only the columns an event needs
+    zayavki = queries.calendar_rows(start, end).all()
     events = []
 
     for z in zayavki:
         if z.created_at:
             events.append({
+                "id": z.id,
                 "title": f"{z.type} ({z.status})",
                 "start": z.created_at.strftime('%Y-%m-%d'),
                 "color": get_status_color(z.status)
             })
 
-    return jsonify(events)
+    response = jsonify(events)
+    response.set_etag(etag)
+    response.last_modified = changed_at
+    response.cache_control.no_cache = True
+    return response
+
+
+def request_json(z):
+    # Everything an admin card shows; used by /api/requests and "created" stream events
+    return {
+        'id': z.id,
+        'type': z.type,
+        'status': z.status,
+        'start': z.created_at.strftime('%Y-%m-%d'),
+        'color': get_status_color(z.status),
+        'description': z.description,
+        'created_at': z.created_at.strftime('%d.%m.%Y %H:%M'),
+        'urgent': bool(z.urgent),
+        'file_url': url_for('uploaded_file', filename=z.file) if z.file else None,
+        'thumb_url': media.url(z.file, 'thumb'),
+        'username': z.user.username,
+        'full_name': z.user.full_name,
+        'faculty': z.user.faculty,
+        'comment': z.comment
+    }
+
+def change_payload(kind, z):
+    # Compact event body: enough to patch an admin card or a calendar event in place
+    if kind == 'created':
+        return request_json(z)
+    payload = {'id': z.id}
+    if kind == 'deleted':
+        return payload
+    payload.update({
+        'type': z.type,
+        'status': z.status,
+        'start': z.created_at.strftime('%Y-%m-%d'),
+        'color': get_status_color(z.status)
+    })
+    if kind == 'feedback':
+        payload.update({'comment': z.comment, 'rating': z.rating})
+    return payload
+
+def record_change(kind, z):
+    # Called before commit so the event is written in the same transaction as the change
+    db.session.flush()
+    db.session.add(ChangeEvent(
+        kind=kind,
+        zayavka_id=z.id,
+        payload=json.dumps(change_payload(kind, z), ensure_ascii=False)
+    ))
+    DataVersion.bump()
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=app.config['CHANGE_LOG_RETENTION_HOURS'])
+    ChangeEvent.query.filter(ChangeEvent.created_at < cutoff).delete(synchronize_session=False)
+
+_sse_slots = None
+_sse_slots_lock = threading.Lock()
+
+def sse_slots():
+    # Per process, so after gunicorn forks every worker has its own
+    global _sse_slots
+    with _sse_slots_lock:
+        if _sse_slots is None:
+            _sse_slots = threading.BoundedSemaphore(app.config['SSE_MAX_STREAMS_PER_WORKER'])
+        return _sse_slots
+
+@app.route('/stream/requests')
+@role_required('admin')
+def stream_requests():
+    # Every gunicorn worker tails the shared change_event table, so events reach all open streams
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = db.session.query(db.func.max(ChangeEvent.id)).scalar() or 0
+    db.session.rollback()
+
+    if not sse_slots().acquire(blocking=False):
+        # Every stream slot is taken: answer at once and let EventSource reconnect later
+        app.logger.warning("SSE stream refused: all stream slots in use")
+        response = Response(f"retry: {app.config['SSE_OVERFLOW_RETRY_MS']}\n\n", mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    poll_interval = app.config['SSE_POLL_INTERVAL']
+    heartbeat_interval = app.config['SSE_HEARTBEAT_INTERVAL']
+    max_seconds = app.config['SSE_MAX_STREAM_SECONDS']
+
+    def generate(last_id):
+        started = last_sent = time.monotonic()
+        yield 'retry: 3000\n\n'
+        while time.monotonic() - started < max_seconds:
+            rows = db.session.query(ChangeEvent.id, ChangeEvent.kind, ChangeEvent.payload) \
+                .filter(ChangeEvent.id > last_id).order_by(ChangeEvent.id).limit(100).all()
+            db.session.rollback()  # Don't hold a read transaction open between polls
+            for event_id, kind, payload in rows:
+                last_id = event_id
+                yield f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+            now = time.monotonic()
+            if rows:
+                last_sent = now
+            elif now - last_sent >= heartbeat_interval:
+                last_sent = now
+                yield ': keep-alive\n\n'
+            time.sleep(poll_interval)
+
+    response = Response(stream_with_context(generate(last_id)), mimetype='text/event-stream')
+    response.call_on_close(sse_slots().release)  # Runs even if the client left before the first event
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
 
 
 def get_status_color(status):
@@ -597,6 +942,154 @@ def get_status_color(status):
     }.get(status, 'lightblue')
 
 
+# SQL statements each listing/export may run; more usually means an N+1 came back
+QUERY_BUDGETS = [
+    # (method, path, role, max statements)
+    ('GET', '/admin', 'admin', 2),
+    ('GET', '/api/requests', 'admin', 2),
+    ('GET', '/history', 'admin', 1),
+    ('GET', '/api/calendar_events', 'admin', 2),
+    ('POST', '/generate_report', 'admin', 2),  # report_cache version check + the report itself
+    ('GET', '/export_requests', 'admin', 1),
+    ('GET', '/api/stats?group_by=type', 'admin', 1),
+    ('GET', '/my-requests', 'employee', 1),
+]
+
+@app.cli.command('check-queries')
+def check_queries():
+    """Run each listing route once and fail if it exceeds its SQL statement budget.
+
+    Reports are written to a throwaway cache folder, so the real report cache is left alone.
+    """
+    with tempfile.TemporaryDirectory() as cache_folder:
+        report_cache_folder = app.config['REPORT_CACHE_FOLDER']
+        app.config['REPORT_CACHE_FOLDER'] = cache_folder
+        try:
+            failed = run_query_budgets()
+        finally:
+            app.config['REPORT_CACHE_FOLDER'] = report_cache_folder
+    if failed:
+        raise SystemExit(1)
+
+def run_query_budgets():
+    failed = False
+    for method, path, role, budget in QUERY_BUDGETS:
+        user = User.query.filter_by(role=role).first()
+        if not user:
+            click.echo(f"SKIP {method} {path}: no {role} user")
+            continue
+        client = app.test_client()
+        with client.session_transaction() as client_session:
+            client_session['user_id'] = user.id
+            client_session['role'] = role
+        with queries.count_statements() as statements:
+            response = client.open(path, method=method)
+            response.get_data()  # Streamed bodies run their queries while being read
+            response.close()
+        ok = len(statements) <= budget
+        failed = failed or not ok
+        click.echo(f"{'OK  ' if ok else 'FAIL'} {method} {path}: {len(statements)} statements (budget {budget})")
+        if not ok:
+            for statement in statements:
+                click.echo(f"    {' '.join(statement.split())[:160]}")
+    return failed
+
+@app.cli.command('db-audit')
+def db_audit():
+    """Print EXPLAIN QUERY PLAN for each route's query and flag full table scans."""
+    connection = db.session.connection()
+    failed = False
+    for name, query, full_scan_expected in queries.audited_queries():
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+        click.echo(name)
+        for row in plan:
+            detail = row[-1]
+            full_scan = detail.startswith('SCAN ') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail
+            if full_scan and not full_scan_expected:
+                failed = True
+                marker = '!! full table scan'
+            elif full_scan:
+                marker = '(expected: full export)'
+            elif 'TEMP B-TREE' in detail:
+                marker = '!  sort not served by an index'
+            else:
+                marker = ''
+            click.echo(f"    {detail}  {marker}".rstrip())
+    if failed:
+        raise SystemExit(1)
+
+counters_cli = AppGroup('counters', help='Status/type badge counters.')
+
+@counters_cli.command('reconcile')
+def reconcile_counters():
+    """Recompute the badge counters from zayavka and repair drift (run from cron)."""
+    drift = RequestCounter.reconcile()
+    db.session.commit()
+    for kind, key, stored, actual in drift:
+        click.echo(f"{kind} {key!r}: {stored} -> {actual}")
+    click.echo(f"Counters reconciled, {len(drift)} drifted.")
+
+app.cli.add_command(counters_cli)
+
+
+stats_cli = AppGroup('stats', help='Pre-aggregated request statistics (request_rollup).')
+
+@stats_cli.command('backfill')
+def backfill_stats():
+    """Rebuild request_rollup from zayavka (after imports, or if the rollups look off)."""
+    rows = RequestRollup.rebuild()
+    db.session.commit()
+    click.echo(f"Rollups rebuilt: {rows} rows.")
+
+app.cli.add_command(stats_cli)
+
+archive_cli = AppGroup('archive', help='Excel archives of closed requests.')
+
+@archive_cli.command('compact')
+def compact_archives():
+    """Rebuild archive workbooks that are behind their log (run from cron)."""
+    for filename in app.config['ARCHIVE_FILES'].values():
+        rewritten = archive.compact(filename)
+        click.echo(f"{filename}: {'rebuilt' if rewritten else 'up to date'}")
+
+app.cli.add_command(archive_cli)
+
+reports_cli = AppGroup('reports', help='Downloadable request reports.')
+
+@reports_cli.command('pregenerate')
+@click.option('--month', type=click.IntRange(1, 12), help='Defaults to the previous month.')
+@click.option('--year', type=int)
+@click.option('--format', 'formats', multiple=True, type=click.Choice(list(report_jobs.FORMATS)),
+              help='Repeatable; all formats by default.')
+def pregenerate_reports(month, year, formats):
+    """Build a month's reports into the report cache off-peak (run from cron on the 1st)."""
+    if not month:
+        month, year = report_jobs.previous_month()
+    for format, path, hit in report_jobs.pregenerate(month, year, formats):
+        click.echo(f"{format}: {'up to date' if hit else 'generated'} {path}")
+
+app.cli.add_command(reports_cli)
+
+uploads_cli = AppGroup('uploads', help='Uploaded attachments and profile photos.')
+
+@uploads_cli.command('import')
+def import_uploads():
+    """Move pre-dedup uploads into the content-addressed store, deduplicating them."""
+    imported, rewritten = storage.import_legacy()
+    click.echo(f"Imported {imported} files, {rewritten} references rewritten.")
+
+@uploads_cli.command('gc')
+@click.option('--grace-hours', type=float, help='Only files older than this (default UPLOAD_GC_GRACE_HOURS).')
+@click.option('--delete', is_flag=True, help='Delete orphans instead of moving them to quarantine.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be reclaimed.')
+def collect_uploads(grace_hours, delete, dry_run):
+    """Remove uploads nothing refers to any more (deleted requests, replaced photos)."""
+    files, reclaimed = upload_gc.collect(grace_hours, quarantine=not delete, dry_run=dry_run)
+    action = 'would be reclaimed' if dry_run else 'deleted' if delete else 'quarantined'
+    click.echo(f"{files} orphaned files, {reclaimed / (1024 * 1024):.1f} MB {action}.")
+
+app.cli.add_command(uploads_cli)
 
 if __name__ == '__main__':
     from flask_migrate import Migrate
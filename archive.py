@@ -0,0 +1,113 @@
+"""Excel archives of closed requests (e.g. uploads/завершённые_заявки.xlsx).
+
+Archiving a request only inserts an ArchiveRow in the caller's transaction,
+so it costs the same however big the archive is, and workers never touch the
+file concurrently. compact() rebuilds the workbook from the log in one
+write-only pass, under a file lock, and only when rows were added since the
+last rebuild. Run it from cron (`flask archive compact`) or let /archive/<name>
+do it on download.
+
+Workbooks written before the log existed are imported into it (as legacy
+rows, kept ahead of the logged ones) the first time they are compacted.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+import openpyxl
+from flask import current_app
+
+from models import db, ArchiveRow
+import queries
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server, nothing to lock against
+    fcntl = None
+
+HEADERS = ["Тип заявки", "Описание", "Дата", "Статус", "Файл", "Кто оставил заявку", "Факультет"]
+MARKER = 'archive-log'  # Stored with the last compacted row id in the workbook's keywords
+
+def archive_path(filename):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+
+def append(zayavka, filename):
+    """Log one row for the archive; the caller commits."""
+    user = zayavka.user
+    db.session.add(ArchiveRow(archive=filename, values=json.dumps([
+        zayavka.type,
+        zayavka.description,
+        zayavka.created_at.strftime('%d.%m.%Y %H:%M'),
+        zayavka.status,
+        zayavka.file if zayavka.file else "Нет файла",
+        user.username if user else None,
+        user.faculty if user else None,
+    ], ensure_ascii=False)))
+
+@contextmanager
+def file_lock(path):
+    with open(path + '.lock', 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def compacted_through(path):
+    """Last ArchiveRow id in a workbook written by compact(); None for a legacy workbook."""
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        marker, _, last_id = (workbook.properties.keywords or '').partition(':')
+    finally:
+        workbook.close()
+    return int(last_id) if marker == MARKER and last_id.isdigit() else None
+
+def import_legacy(filename, path):
+    if db.session.query(ArchiveRow.id).filter_by(archive=filename, legacy=True).first():
+        return 0  # Imported before, but the rebuild that followed didn't finish
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(min_row=2, values_only=True)
+        db.session.add_all(
+            ArchiveRow(archive=filename, legacy=True, values=json.dumps(
+                [value if value is None or isinstance(value, (int, float)) else str(value) for value in row],
+                ensure_ascii=False
+            ))
+            for row in rows if any(value is not None for value in row)
+        )
+    finally:
+        workbook.close()
+    db.session.commit()
+    return db.session.query(ArchiveRow).filter_by(archive=filename, legacy=True).count()
+
+def compact(filename):
+    """Rebuild the workbook from the log if it is behind; returns True when it was rewritten."""
+    path = archive_path(filename)
+    with file_lock(path):
+        last_id = db.session.query(db.func.max(ArchiveRow.id)).filter_by(archive=filename).scalar()
+        if os.path.exists(path):
+            done = compacted_through(path)
+            if done is None:
+                imported = import_legacy(filename, path)
+                current_app.logger.info(f"Imported {imported} rows from legacy archive {path}")
+                last_id = db.session.query(db.func.max(ArchiveRow.id)).filter_by(archive=filename).scalar()
+            elif done == last_id:
+                return False
+        if last_id is None:
+            return False
+
+        rows = db.session.query(ArchiveRow.values).filter(ArchiveRow.archive == filename, ArchiveRow.id <= last_id) \
+            .order_by(ArchiveRow.legacy.desc(), ArchiveRow.id).yield_per(queries.STREAM_BATCH)
+        workbook = openpyxl.Workbook(write_only=True)
+        workbook.properties.keywords = f'{MARKER}:{last_id}'
+        sheet = workbook.create_sheet("Заявки")
+        sheet.append(HEADERS)
+        for (values,) in rows:
+            sheet.append(json.loads(values))
+        partial = path + '.part'
+        workbook.save(partial)
+        os.replace(partial, path)
+    current_app.logger.info(f"Archive compacted: {path} (through row {last_id})")
+    return True
@@ -0,0 +1,208 @@
+"""Benchmarks on a synthetic database.
+
+    python bench.py projections --rows 100000
+    python bench.py pdf --rows 100000      # also times a tenth of the rows, to check linear growth
+    python bench.py word --rows 20000      # bulk XML table vs table.add_row() on a tenth of the rows
+
+--no-trace skips tracemalloc, which slows pure-Python code such as reportlab several times over.
+
+Runs against a throwaway SQLite file (via DATABASE_URL), never database.db.
+Results go to stdout; redirect to bench_output.txt to keep them.
+"""
+import argparse
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+WORDS = ('принтер', 'картридж', 'монитор', 'не', 'работает', 'кабинет', 'замена', 'срочно',
+         'ноутбук', 'сеть', 'интернет', 'проектор', 'аудитория', 'клавиатура', 'мышь')
+TYPES = ('Картридж Canon 737', 'Монитор Samsung 24', 'Ремонт', 'Оборудование', 'Проектор ViewSonic')
+STATUSES = ('ожидает', 'принято', 'отклонено', 'сделано')
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def seed(db, rows, users=200):
+    rng = random.Random(42)
+    connection = db.engine.raw_connection()
+    cursor = connection.cursor()
+    cursor.executemany(
+        "INSERT INTO user (id, username, email, password, role, full_name, faculty, position) "
+        "VALUES (?, ?, ?, ?, 'employee', ?, ?, ?)",
+        [(i, f'user{i}', f'user{i}@example.com', 'x' * 100, f'Сотрудник {i}', f'Факультет {i % 12}', 'Преподаватель')
+         for i in range(1, users + 1)]
+    )
+    start = datetime(2022, 1, 1)
+    batch = []
+    for i in range(1, rows + 1):
+        batch.append((
+            i, rng.choice(TYPES), text(rng, 150), rng.choice(STATUSES),
+            (start + timedelta(minutes=17 * i)).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            rng.randint(1, users), text(rng, 60) if i % 3 else None, rng.randint(1, 5), i % 7 == 0
+        ))
+        if len(batch) == 10000:
+            cursor.executemany(
+                "INSERT INTO zayavka (id, type, description, status, created_at, user_id, comment, rating, urgent) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        cursor.executemany(
+            "INSERT INTO zayavka (id, type, description, status, created_at, user_id, comment, rating, urgent) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    connection.commit()
+    connection.close()
+
+TRACE = True
+
+def measure(db, fn):
+    # Wall time and peak Python heap of one call; the session is cleared so nothing is reused
+    db.session.expunge_all()
+    gc.collect()
+    if TRACE:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if TRACE:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    count = result if isinstance(result, int) else len(result)
+    del result
+    db.session.expunge_all()
+    return elapsed, peak / 2 ** 20, count
+
+def report(title, cases, db, scaling=False):
+    # scaling=True: the cases are one implementation at growing sizes, so show cost per row
+    print(title)
+    baseline = None
+    for name, fn in cases:
+        elapsed, peak, count = measure(db, fn)
+        if scaling:
+            note = f'  ({elapsed / max(count, 1) * 1000:.3f} ms/row)'
+        elif baseline is None:
+            baseline = (elapsed, peak)
+            note = ''
+        else:
+            note = f'  ({baseline[0] / elapsed:.1f}x faster, {baseline[1] / max(peak, 1):.1f}x less memory)'
+        memory = f'{peak:9.1f} MiB' if TRACE else '        - MiB'
+        print(f'    {name:<32} {count:>8} rows {elapsed:8.2f} s {memory}{note}')
+
+def bench_projections(args):
+    from sqlalchemy.orm import contains_eager, joinedload
+    from app import app
+    from models import db, User, Zayavka
+    import queries
+
+    with app.app_context():
+        db.create_all()
+        print(f'Seeding {args.rows} requests...')
+        seed(db, args.rows)
+
+        report('/api/calendar_events (whole table)', [
+            ('full entities', lambda: Zayavka.query.order_by(Zayavka.created_at).all()),
+            ('column tuples', lambda: queries.calendar_rows().all()),
+        ], db)
+        report('Report rows (whole table)', [
+            ('full entities + users', lambda: Zayavka.query.join(User, Zayavka.user_id == User.id)
+                .options(contains_eager(Zayavka.user)).all()),
+            ('column tuples', lambda: queries.report_table().all()),
+        ], db)
+        report('/export_requests', [
+            ('full entities + users', lambda: Zayavka.query.options(joinedload(Zayavka.user)).all()),
+            ('column tuples', lambda: queries.export_table().all()),
+        ], db)
+
+def counted(rows):
+    # Wraps a row iterator so a file-producing benchmark can still report how many rows it wrote
+    counter = {'rows': 0}
+    def each():
+        for row in rows:
+            counter['rows'] += 1
+            yield row
+    return each(), counter
+
+def write_report(generate, rows):
+    rows, counter = counted(rows)
+    with tempfile.TemporaryFile() as output:
+        generate(rows, output=output)
+    return counter['rows']
+
+def bench_pdf(args):
+    from app import app
+    from models import db
+    from utils import generate_pdf_report, pdf_font
+    import queries
+
+    with app.app_context():
+        db.create_all()
+        print(f'Seeding {args.rows} requests...')
+        seed(db, args.rows)
+        print(f'PDF font: {pdf_font()}')
+
+        sizes = sorted({max(args.rows // 10, 1), args.rows})
+        report('generate_pdf_report', [
+            (f'{size} rows', lambda size=size: write_report(generate_pdf_report, queries.report_table().limit(size)))
+            for size in sizes
+        ], db, scaling=True)
+
+def add_row_word_report(rows, output):
+    # The old generate_word_report loop, kept here as the baseline
+    from docx import Document
+    doc = Document()
+    table = doc.add_table(rows=1, cols=4)
+    for username, type_, description, status, created_at in rows:
+        cells = table.add_row().cells
+        cells[0].text = username
+        cells[1].text = type_
+        cells[2].text = description
+        cells[3].text = created_at.strftime('%d.%m.%Y %H:%M')
+    doc.save(output)
+
+def bench_word(args):
+    from app import app
+    from models import db
+    from utils import generate_word_report
+    import queries
+
+    with app.app_context():
+        db.create_all()
+        print(f'Seeding {args.rows} requests...')
+        seed(db, args.rows)
+
+        # add_row() is quadratic, so the baseline only gets a tenth of the rows
+        small = max(args.rows // 10, 1)
+        report(f'table.add_row(), {small} rows', [
+            ('add_row', lambda: write_report(add_row_word_report, queries.report_table().limit(small))),
+        ], db, scaling=True)
+        report('generate_word_report', [
+            (f'{size} rows', lambda size=size: write_report(generate_word_report, queries.report_table().limit(size)))
+            for size in sorted({small, args.rows})
+        ], db, scaling=True)
+
+BENCHMARKS = {
+    'projections': bench_projections,
+    'pdf': bench_pdf,
+    'word': bench_word,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--no-trace', action='store_true', help='time only, without tracemalloc')
+    args = parser.parse_args()
+
+    global TRACE
+    TRACE = not args.no_trace
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        BENCHMARKS[args.benchmark](args)
+
+if __name__ == '__main__':
+    main()
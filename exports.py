@@ -0,0 +1,92 @@
+"""Streaming Excel, CSV and NDJSON exports.
+
+Rows are pulled from the database in batches (yield_per) and appended to an
+openpyxl write-only workbook, which spills each row to disk instead of
+keeping cell objects in memory. The finished file goes to a spooled
+temporary file that is deleted when the response is closed, so memory stays
+flat no matter how many rows are exported.
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime
+
+import openpyxl
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+SPOOL_MAX_SIZE = 1024 * 1024  # Files up to 1 MB stay in memory, bigger ones roll over to disk
+
+def format_date(value, fmt='%Y-%m-%d %H:%M'):
+    return value.strftime(fmt) if value else ''
+
+def write_xlsx(headers, rows, sheet_title='Отчёт', output=None):
+    """Write `rows` (any iterable of tuples) to an xlsx file.
+
+    With no `output`, returns a self-deleting file object positioned at the
+    start, ready for send_file. Otherwise the workbook is saved to `output`
+    (a path or file object), which is returned as is.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title)
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+
+    if output is not None:
+        workbook.save(output)
+        return output
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, suffix='.xlsx')
+    workbook.save(spool)
+    spool.seek(0)
+    return spool
+
+REPORT_HEADERS = ['Сотрудник', 'Тип', 'Описание', 'Статус', 'Дата']
+
+def report_xlsx(rows, output=None):
+    # rows: queries.report_table()
+    return write_xlsx(REPORT_HEADERS, (
+        (username, type_, description, status, format_date(created_at))
+        for username, type_, description, status, created_at in rows
+    ), output=output)
+
+EXPORT_HEADERS = ['ID', 'Тип', 'Описание', 'Дата', 'Пользователь', 'Статус']
+
+def requests_xlsx(rows):
+    # rows: queries.export_table(); user_id is None when the user was deleted
+    return write_xlsx(EXPORT_HEADERS, (
+        (id_, type_, description, format_date(created_at), full_name if user_id else 'Неизвестно', status)
+        for id_, type_, description, created_at, user_id, full_name, status in rows
+    ), sheet_title='Заявки')
+
+CSV_MIMETYPE = 'text/csv; charset=utf-8'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def machine_value(value):
+    # ISO 8601 timestamps, so a client can pass updated_at back as ?updated_since=
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def csv_chunks(fields, rows, batch=1000):
+    """CSV text for a generator response: header first, then one chunk per `batch` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([machine_value(value) for value in row])
+        if count % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def ndjson_chunks(fields, rows, batch=1000):
+    """One JSON object per line, grouped into chunks of `batch` lines."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, map(machine_value, row))), ensure_ascii=False))
+        if len(lines) == batch:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,122 @@
+"""Resized variants of uploaded images: profile photos and image attachments.
+
+Each content-addressed image (storage.py) gets a "thumb" and a "medium"
+variant, as WebP and as JPEG for browsers that don't accept WebP. They are
+rendered by upload_pipeline's thread pool once the upload has passed the
+virus scan, so the request that uploaded the image doesn't wait for Pillow. /media/<sha256>/<size>
+serves them; a variant that isn't there yet (or was evicted) is rendered on
+the spot.
+
+Variants live in MEDIA_FOLDER, named after the blob hash and the pixel size,
+so they are as immutable as the blob itself. Once the folder grows past
+MEDIA_CACHE_MAX_BYTES the least recently served ones are evicted.
+"""
+import os
+
+from flask import current_app, request, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import send_file
+
+import storage
+from utils import atomic_path, evict_lru
+
+SIZES = {'thumb': 240, 'medium': 1024}  # Longest side in pixels
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+QUALITY = 80
+
+def image_hash(name):
+    # sha256 of a stored image, None for other attachments and legacy flat names
+    sha256 = storage.content_hash(name)
+    if sha256 and os.path.splitext(name)[1] in IMAGE_EXTENSIONS:
+        return sha256
+    return None
+
+def url(name, size):
+    """URL of a variant of a stored name, or None if it isn't a content-addressed image."""
+    sha256 = image_hash(name)
+    return url_for('media_variant', sha256=sha256, size=size) if sha256 else None
+
+def variant_path(sha256, size, format):
+    return os.path.join(current_app.config['MEDIA_FOLDER'], sha256[:2], f'{sha256}-{SIZES[size]}.{format}')
+
+def render(sha256, size, format):
+    path = variant_path(sha256, size, format)
+    pixels = SIZES[size]
+    with Image.open(storage.blob_path(sha256)) as image:
+        image.draft('RGB', (pixels, pixels))  # JPEG: decode at a reduced scale, much faster
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((pixels, pixels))
+        if 'A' in image.getbands() or 'transparency' in image.info:
+            image = image.convert('RGBA')
+            if format == 'jpeg':
+                # No alpha in JPEG; flatten onto white rather than the default black
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_path(path) as partial:
+            image.save(partial, FORMATS[format][0], quality=QUALITY)
+    return path
+
+def variant(sha256, size, format):
+    """Path of a variant, rendering it if missing; NotFound if the blob isn't a readable image."""
+    path = variant_path(sha256, size, format)
+    if os.path.exists(path):
+        os.utime(path)  # Most recently used, for evict_lru
+        return path
+    if not os.path.exists(storage.blob_path(sha256)):
+        raise NotFound()
+    try:
+        return render(sha256, size, format)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        current_app.logger.warning(f"No {size} variant for {sha256}: {exc}")
+        raise NotFound()
+
+def response(sha256, size):
+    format = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    rv = send_file(
+        variant(sha256, size, format), request.environ, mimetype=FORMATS[format][1],
+        etag=f'{sha256}-{SIZES[size]}-{format}', max_age=storage.IMMUTABLE_MAX_AGE,
+        response_class=current_app.response_class,
+    )
+    rv.cache_control.immutable = True
+    rv.vary.add('Accept')
+    return rv
+
+def render_all(sha256):
+    # Every size and format of a new image, then trim the cache; run by upload_pipeline
+    try:
+        for size in SIZES:
+            for format in FORMATS:
+                if not os.path.exists(variant_path(sha256, size, format)):
+                    render(sha256, size, format)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        current_app.logger.warning(f"No variants for {sha256}: {exc}")  # Named like an image, isn't one
+    evict()
+
+def variant_files():
+    folder = current_app.config['MEDIA_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    with os.scandir(folder) as shards:
+        for shard in shards:
+            if shard.is_dir():
+                with os.scandir(shard.path) as entries:
+                    yield from (entry for entry in entries if entry.is_file() and not entry.name.endswith('.part'))
+
+def evict():
+    """Delete least recently served variants until the folder fits MEDIA_CACHE_MAX_BYTES."""
+    evict_lru(variant_files(), current_app.config['MEDIA_CACHE_MAX_BYTES'])
+
+def remove(sha256):
+    # The blob itself is going away
+    for size in SIZES:
+        for format in FORMATS:
+            try:
+                os.remove(variant_path(sha256, size, format))
+            except FileNotFoundError:
+                pass
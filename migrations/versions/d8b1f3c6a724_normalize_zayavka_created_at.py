@@ -0,0 +1,27 @@
+"""Store every zayavka.created_at with microseconds
+
+Revision ID: d8b1f3c6a724
+Revises: c4f7a9e2d561
+Create Date: 2025-06-09 09:14:26.371905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8b1f3c6a724'
+down_revision = 'c4f7a9e2d561'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows from the old func.now() default have no fractional part; SQLite compares the
+    # text, so "10:00:05" sorted before "10:00:05.000000" and keyset pages overlapped
+    op.execute("UPDATE zayavka SET created_at = created_at || '.000000' WHERE created_at NOT LIKE '%.%'")
+
+
+def downgrade():
+    # Both forms read back as the same datetime; nothing to undo
+    pass
@@ -0,0 +1,76 @@
+"""Add FTS5 full-text search index for zayavka
+
+Revision ID: d92a6b3e5f17
+Revises: c4f7d2e81a90
+Create Date: 2025-05-12 11:27:40.918364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd92a6b3e5f17'
+down_revision = 'c4f7d2e81a90'
+branch_labels = None
+depends_on = None
+
+
+# ё is folded to е on both sides (unicode61 only folds case for Cyrillic)
+def _fold(expr):
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _insert_rows(zayavka, user, where):
+    return f"""
+        INSERT INTO zayavka_fts(rowid, description, username, full_name)
+        SELECT {zayavka}.id, {_fold(f'{zayavka}.description')}, {_fold(f'{user}.username')}, {_fold(f'{user}.full_name')}
+        FROM {where}"""
+
+
+def fts5_available(conn):
+    return any(row[0] == 'ENABLE_FTS5' for row in conn.execute(sa.text("PRAGMA compile_options")))
+
+
+def upgrade():
+    conn = op.get_bind()
+    if not fts5_available(conn):
+        # admin() falls back to LIKE when zayavka_fts is missing
+        return
+
+    op.execute("""
+        CREATE VIRTUAL TABLE zayavka_fts USING fts5(
+            description, username, full_name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )""")
+
+    op.execute(f"""
+        CREATE TRIGGER zayavka_fts_ai AFTER INSERT ON zayavka BEGIN
+            {_insert_rows('new', 'u', 'user u WHERE u.id = new.user_id')};
+        END""")
+    op.execute("""
+        CREATE TRIGGER zayavka_fts_ad AFTER DELETE ON zayavka BEGIN
+            DELETE FROM zayavka_fts WHERE rowid = old.id;
+        END""")
+    op.execute(f"""
+        CREATE TRIGGER zayavka_fts_au AFTER UPDATE OF description, user_id ON zayavka BEGIN
+            DELETE FROM zayavka_fts WHERE rowid = old.id;
+            {_insert_rows('new', 'u', 'user u WHERE u.id = new.user_id')};
+        END""")
+    op.execute(f"""
+        CREATE TRIGGER user_fts_au AFTER UPDATE OF username, full_name ON user BEGIN
+            DELETE FROM zayavka_fts WHERE rowid IN (SELECT id FROM zayavka WHERE user_id = new.id);
+            {_insert_rows('z', 'new', 'zayavka z WHERE z.user_id = new.id')};
+        END""")
+
+    # Backfill existing requests
+    op.execute(_insert_rows('z', 'u', 'zayavka z JOIN user u ON u.id = z.user_id'))
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS user_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS zayavka_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS zayavka_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS zayavka_fts_ai")
+    op.execute("DROP TABLE IF EXISTS zayavka_fts")
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 db = SQLAlchemy()
 
@@ -19,6 +20,15 @@ from datetime import datetime
 from sqlalchemy import Enum
 
 class Zayavka(db.Model):
+    # Every listing filters on one of these and sorts by created_at
+    __table_args__ = (
+        db.Index('ix_zayavka_status_created_at', 'status', 'created_at'),
+        db.Index('ix_zayavka_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_zayavka_type_created_at', 'type', 'created_at'),
+        # Covers queries.report_version, so cached reports are validated from the index alone
+        db.Index('ix_zayavka_created_at_updated_at', 'created_at', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(50), nullable=False)  # Equipment or Repair
     description = db.Column(db.Text, nullable=False)
@@ -27,20 +37,34 @@ class Zayavka(db.Model):
         default='ожидает',  # Standardized default status
         nullable=False
     )
-    created_at = db.Column(db.DateTime, default=db.func.now())
+    # Set in Python like updated_at, so every row has the same text form ("… 10:00:05.000000");
+    # func.now() wrote "… 10:00:05", which sorts apart from it and broke keyset pages
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    file = db.Column(db.String(200), nullable=True)
+    file = db.Column(db.String(200), nullable=True, index=True)  # index: /uploads checks the name is stored
+    file_name = db.Column(db.String(200), nullable=True)  # Name the attachment was uploaded under, offered on download
     user = db.relationship('User', backref=db.backref('zayavki', lazy=True))
     comment = db.Column(db.Text, nullable=True)  # User comment
     rating = db.Column(db.Integer, nullable=True)  # User rating (1-5)
     confirmed_by_user = db.Column(db.Boolean, default=False)  # User confirmation for archive
     urgent = db.Column(db.Boolean, default=False)  # Field to mark a request as urgent
+    faculty = db.Column(db.String(150), nullable=True)  # Author's faculty when the request was sent; rollups count this
+    # Bumped by every ORM write. Set in Python, so it keeps microseconds: two edits
+    # within the same second must still produce different values (queries.report_version)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # index: ?updated_since exports
 
-    def set_status(self, new_status):
+    def set_status(self, new_status, changed_by=None):
         valid_statuses = ['ожидает', 'принято', 'отклонено', 'сделано', 'неизвестно']
         if new_status.lower() not in valid_statuses:
             raise ValueError(f"Invalid status: {new_status}")
+        old_status = self.status
+        before = RequestRollup.facts(self) if self.id is not None else None
         self.status = new_status.lower()  # Store status in lowercase
+        if self.id is not None and old_status != self.status:
+            RequestCounter.move(self, old_status, self.status)
+            RequestRollup.change(before, self)
+            db.session.add(StatusChange(zayavka_id=self.id, old_status=old_status,
+                                        new_status=self.status, changed_by=changed_by))
 
 class ActionLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,3 +74,252 @@ class ActionLog(db.Model):
     zayavka_id = db.Column(db.Integer, db.ForeignKey('zayavka.id'), nullable=True)
     user = db.relationship('User', backref=db.backref('actions', lazy=True))
     zayavka = db.relationship('Zayavka', backref=db.backref('actions', lazy=True))
+
+class DataVersion(db.Model):
+    # Single-row write counter shared by all workers; bumped on every write to zayavka
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def bump(cls):
+        # Runs inside the caller's transaction, so the counter commits together with the change
+        now = datetime.utcnow().replace(microsecond=0)
+        updated = cls.query.filter_by(id=1).update({'version': cls.version + 1, 'updated_at': now})
+        if not updated:
+            db.session.add(cls(id=1, version=1, updated_at=now))
+
+    @classmethod
+    def current(cls):
+        # One tiny query: (version, updated_at, max zayavka id)
+        version, updated_at, max_id = db.session.query(
+            db.session.query(cls.version).filter(cls.id == 1).scalar_subquery(),
+            db.session.query(cls.updated_at).filter(cls.id == 1).scalar_subquery(),
+            db.session.query(db.func.max(Zayavka.id)).scalar_subquery()
+        ).one()
+        return version or 0, updated_at, max_id or 0
+
+class ChangeEvent(db.Model):
+    # Append-only change log; every worker's /stream/requests tails it by id
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # created / status / feedback / deleted
+    zayavka_id = db.Column(db.Integer, nullable=False)  # No FK: deleted requests keep their events
+    payload = db.Column(db.Text, nullable=False)  # Compact JSON sent to the browser as-is
+    created_at = db.Column(db.DateTime, default=db.func.now(), index=True)
+
+class StatusChange(db.Model):
+    # Status history, one row per transition, for resolution times (analytics.py).
+    # old_status is None on the row written when a request is created.
+    __table_args__ = (
+        db.Index('ix_status_change_new_status_zayavka_id', 'new_status', 'zayavka_id', 'changed_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    zayavka_id = db.Column(db.Integer, nullable=False, index=True)  # No FK, like ChangeEvent
+    old_status = db.Column(db.String(20), nullable=True)
+    new_status = db.Column(db.String(20), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    changed_by = db.Column(db.Integer, nullable=True)  # user.id of the admin, when known
+
+class RequestCounter(db.Model):
+    # Badge counts kept in step with zayavka inside the same transactions:
+    # ('status', <status>), ('type', <type>), ('urgent', <status>)
+    kind = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def add(cls, kind, key, delta):
+        # Upsert, so concurrent workers can't race on the first insert of a key
+        statement = sqlite_insert(cls.__table__).values(kind=kind, key=key, count=delta)
+        statement = statement.on_conflict_do_update(
+            index_elements=['kind', 'key'],
+            set_={'count': cls.__table__.c.count + statement.excluded.count}
+        )
+        db.session.execute(statement)
+
+    @classmethod
+    def track(cls, zayavka, delta):
+        # +1 when a request is created, -1 when it is deleted
+        cls.add('status', zayavka.status, delta)
+        cls.add('type', zayavka.type, delta)
+        if zayavka.urgent:
+            cls.add('urgent', zayavka.status, delta)
+
+    @classmethod
+    def move(cls, zayavka, old_status, new_status):
+        cls.add('status', old_status, -1)
+        cls.add('status', new_status, 1)
+        if zayavka.urgent:
+            cls.add('urgent', old_status, -1)
+            cls.add('urgent', new_status, 1)
+
+    @classmethod
+    def snapshot(cls):
+        # {'status': {...}, 'type': {...}, 'urgent': {...}}; one small query, independent of zayavka size
+        counters = {'status': {}, 'type': {}, 'urgent': {}}
+        for kind, key, count in db.session.query(cls.kind, cls.key, cls.count):
+            counters.setdefault(kind, {})[key] = count
+        return counters
+
+    @classmethod
+    def actual(cls):
+        # The same shape as snapshot(), recomputed from zayavka with GROUP BY
+        counters = {'status': {}, 'type': {}, 'urgent': {}}
+        for status, count in db.session.query(Zayavka.status, db.func.count()).group_by(Zayavka.status):
+            counters['status'][status] = count
+        for type_, count in db.session.query(Zayavka.type, db.func.count()).group_by(Zayavka.type):
+            counters['type'][type_] = count
+        urgent = db.session.query(Zayavka.status, db.func.count()).filter(Zayavka.urgent.is_(True)).group_by(Zayavka.status)
+        for status, count in urgent:
+            counters['urgent'][status] = count
+        return counters
+
+    @classmethod
+    def reconcile(cls):
+        """Rewrite the counters from zayavka; returns the drift that was repaired.
+
+        Drift is a list of (kind, key, stored, actual). The caller commits.
+        """
+        stored, actual = cls.snapshot(), cls.actual()
+        drift = []
+        for kind in ('status', 'type', 'urgent'):
+            for key in sorted(set(stored.get(kind, {})) | set(actual[kind])):
+                before, after = stored.get(kind, {}).get(key, 0), actual[kind].get(key, 0)
+                if before != after:
+                    drift.append((kind, key, before, after))
+        cls.query.delete()
+        db.session.add_all(
+            cls(kind=kind, key=key, count=count)
+            for kind, values in actual.items() for key, count in values.items()
+        )
+        return drift
+
+class RequestRollup(db.Model):
+    """Request counts per day and per month, by type, status, faculty and urgency.
+
+    Kept in step with zayavka inside the same transactions (like RequestCounter),
+    so /api/stats never reads raw requests. A change to a request is applied as
+    -1 for its old facts and +1 for the new ones. `flask stats backfill` rebuilds
+    the table from scratch.
+
+    Faculty is the one stored on the request (zayavka.faculty), not the author's
+    current one, so editing a profile never leaves counts in the wrong bucket.
+    """
+    __tablename__ = 'request_rollup'
+
+    period = db.Column(db.String(5), primary_key=True)  # 'day' / 'month'
+    bucket = db.Column(db.Date, primary_key=True)  # The day, or the first day of the month
+    type = db.Column(db.String(50), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    faculty = db.Column(db.String(150), primary_key=True)  # '' when the author has none
+    urgent = db.Column(db.Boolean, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)  # Requests that have a rating
+
+    @staticmethod
+    def facts(zayavka):
+        # Everything a request contributes; taken before a change and passed to change()
+        created = (zayavka.created_at or datetime.utcnow()).date()
+        return {
+            'day': created,
+            'type': zayavka.type,
+            'status': zayavka.status,
+            'faculty': zayavka.faculty or '',
+            'urgent': bool(zayavka.urgent),
+            'rating': zayavka.rating,
+        }
+
+    @classmethod
+    def add(cls, facts, delta):
+        rated = facts['rating'] is not None
+        for period, bucket in (('day', facts['day']), ('month', facts['day'].replace(day=1))):
+            statement = sqlite_insert(cls.__table__).values(
+                period=period, bucket=bucket, type=facts['type'], status=facts['status'],
+                faculty=facts['faculty'], urgent=facts['urgent'], count=delta,
+                rating_sum=delta * facts['rating'] if rated else 0, rating_count=delta if rated else 0
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=['period', 'bucket', 'type', 'status', 'faculty', 'urgent'],
+                set_={
+                    'count': cls.__table__.c.count + statement.excluded.count,
+                    'rating_sum': cls.__table__.c.rating_sum + statement.excluded.rating_sum,
+                    'rating_count': cls.__table__.c.rating_count + statement.excluded.rating_count,
+                }
+            )
+            db.session.execute(statement)
+
+    @classmethod
+    def track(cls, zayavka, delta):
+        # +1 when a request is created, -1 when it is deleted
+        cls.add(cls.facts(zayavka), delta)
+
+    @classmethod
+    def change(cls, before, zayavka):
+        after = cls.facts(zayavka)
+        if after != before:
+            cls.add(before, -1)
+            cls.add(after, 1)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every row from zayavka with two GROUP BY inserts; the caller commits."""
+        cls.query.delete()
+        faculty = db.func.coalesce(Zayavka.faculty, '')
+        urgent = db.func.coalesce(Zayavka.urgent, False)
+        for period, bucket in (('day', db.func.date(Zayavka.created_at)),
+                               ('month', db.func.strftime('%Y-%m-01', Zayavka.created_at))):
+            rows = db.select(
+                db.literal(period), bucket, Zayavka.type, Zayavka.status, faculty, urgent,
+                db.func.count(), db.func.coalesce(db.func.sum(Zayavka.rating), 0), db.func.count(Zayavka.rating)
+            ).select_from(Zayavka) \
+                .where(Zayavka.created_at.isnot(None)) \
+                .group_by(bucket, Zayavka.type, Zayavka.status, faculty, urgent)
+            db.session.execute(cls.__table__.insert().from_select(
+                ['period', 'bucket', 'type', 'status', 'faculty', 'urgent', 'count', 'rating_sum', 'rating_count'],
+                rows
+            ))
+        return cls.query.count()
+
+class ArchiveRow(db.Model):
+    # Append log behind the Excel archives (archive.py); the xlsx files are rebuilt from it
+    __table_args__ = (
+        db.Index('ix_archive_row_archive_legacy_id', 'archive', 'legacy', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    archive = db.Column(db.String(100), nullable=False)  # File name in UPLOAD_FOLDER
+    values = db.Column(db.Text, nullable=False)  # JSON list, one spreadsheet row
+    legacy = db.Column(db.Boolean, nullable=False, default=False)  # Imported from a pre-log workbook
+    created_at = db.Column(db.DateTime, default=db.func.now())
+
+class Blob(db.Model):
+    # Content-addressed uploads (storage.py): each distinct file is stored once, at
+    # UPLOAD_FOLDER/ab/cd/<sha256>. No reference count: `flask uploads gc` finds
+    # orphans from Zayavka.file / User.photo themselves.
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def record(cls, sha256, size):
+        statement = sqlite_insert(cls.__table__).values(sha256=sha256, size=size, created_at=datetime.utcnow())
+        db.session.execute(statement.on_conflict_do_nothing(index_elements=['sha256']))
+
+class ReportJob(db.Model):
+    # Reports built in the background (report_jobs.py). State lives here rather than in
+    # worker memory so any gunicorn worker can answer status and download requests.
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, also the file name on disk
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    format = db.Column(db.String(10), nullable=False, default='xlsx')
+    params = db.Column(db.Text, nullable=False)  # JSON: {"month": ..., "year": ...}
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / done / failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # Rows written so far
+    total = db.Column(db.Integer, nullable=True)
+    filename = db.Column(db.String(200), nullable=True)  # Name offered on download
+    path = db.Column(db.String(300), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    owner = db.Column(db.String(100), nullable=True)  # "host:pid:token" of the process whose pool runs it
+    created_at = db.Column(db.DateTime, default=db.func.now(), index=True)
+    updated_at = db.Column(db.DateTime, default=db.func.now())  # Heartbeat; see report_jobs.is_stale
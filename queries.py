@@ -0,0 +1,285 @@
+"""Shared queries for request listings and exports.
+
+Zayavka.user is a lazy relationship, so every listing that shows who filed a
+request loads the user in the same statement (contains_eager when the query
+already joins User, joinedload otherwise) instead of one SELECT per row.
+
+Each view also loads only the columns it renders, so description/comment
+(db.Text) and unused user fields stay in the database where they aren't
+shown. raiseload=True turns an access to anything else into an error rather
+than a silent lazy SELECT per row.
+"""
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import contains_eager, joinedload, load_only
+
+from models import db, User, Zayavka, RequestRollup
+
+CARD_COLUMNS = (
+    Zayavka.id, Zayavka.type, Zayavka.description, Zayavka.status,
+    Zayavka.created_at, Zayavka.file, Zayavka.comment, Zayavka.urgent
+)
+
+def admin_queue(type_filter='', status_filter=''):
+    # /admin: everything except completed requests unless asked for explicitly.
+    # Type and status come from fixed dropdowns, so exact matches can use the composite indexes
+    query = Zayavka.query.join(User, Zayavka.user_id == User.id).options(
+        load_only(*CARD_COLUMNS, raiseload=True),
+        contains_eager(Zayavka.user).load_only(User.username, User.full_name, User.faculty, raiseload=True)
+    )
+    if status_filter != 'сделано':
+        query = query.filter(Zayavka.status != 'сделано')
+    if type_filter:
+        query = query.filter(Zayavka.type == type_filter)
+    if status_filter:
+        query = query.filter(Zayavka.status == status_filter)
+    return query
+
+def completed_requests():
+    # /history
+    return Zayavka.query.filter_by(status='сделано').options(
+        load_only(Zayavka.id, Zayavka.type, Zayavka.description, Zayavka.status,
+                  Zayavka.created_at, Zayavka.comment, raiseload=True),
+        joinedload(Zayavka.user).load_only(User.username, User.faculty, raiseload=True)
+    )
+
+def user_requests(user_id):
+    # /my-requests: the user is the viewer, so no join is needed; the cards show almost every column
+    return Zayavka.query.filter_by(user_id=user_id)
+
+STREAM_BATCH = 1000  # Rows fetched per round trip when streaming exports
+
+def report_table(start=None, end=None):
+    # Flat (username, type, description, status, created_at) rows for the Excel, Word and PDF reports
+    query = db.session.query(User.username, Zayavka.type, Zayavka.description, Zayavka.status, Zayavka.created_at) \
+        .join(User, Zayavka.user_id == User.id)
+    if start:
+        query = query.filter(Zayavka.created_at >= start)
+    if end:
+        query = query.filter(Zayavka.created_at < end)
+    return query.order_by(Zayavka.created_at).yield_per(STREAM_BATCH)
+
+def report_version(start=None, end=None):
+    """(count, max updated_at, max id) of the requests in a report's range.
+
+    Any insert, update or delete inside the range changes at least one of the
+    three, so the tuple works as a version for cached report files. Answered
+    from ix_zayavka_created_at_updated_at without touching the table.
+    """
+    query = db.session.query(db.func.count(), db.func.max(Zayavka.updated_at), db.func.max(Zayavka.id))
+    if start:
+        query = query.filter(Zayavka.created_at >= start)
+    if end:
+        query = query.filter(Zayavka.created_at < end)
+    return tuple(query.one())
+
+def export_table():
+    # Flat rows for /export_requests; the outer join keeps requests whose user was deleted
+    return db.session.query(
+        Zayavka.id, Zayavka.type, Zayavka.description, Zayavka.created_at,
+        User.id, User.full_name, Zayavka.status
+    ).outerjoin(User, Zayavka.user_id == User.id).order_by(Zayavka.id).yield_per(STREAM_BATCH)
+
+# Column names of /export/requests.csv and .ndjson, in order
+INTEGRATION_FIELDS = ('id', 'type', 'description', 'status', 'urgent', 'created_at', 'updated_at', 'rating',
+                      'comment', 'confirmed_by_user', 'user_id', 'username', 'full_name', 'faculty', 'position')
+
+def integration_rows(created_from=None, created_to=None, status=None, type_=None, updated_since=None):
+    """Flat INTEGRATION_FIELDS rows for the machine-readable exports, streamed in batches.
+
+    With updated_since only requests changed at or after that moment are returned,
+    oldest change first, so a sync can resume from the last updated_at it received.
+    """
+    query = db.session.query(
+        Zayavka.id, Zayavka.type, Zayavka.description, Zayavka.status, Zayavka.urgent, Zayavka.created_at,
+        Zayavka.updated_at, Zayavka.rating, Zayavka.comment, Zayavka.confirmed_by_user, Zayavka.user_id,
+        User.username, User.full_name, User.faculty, User.position
+    ).outerjoin(User, Zayavka.user_id == User.id)
+    if created_from:
+        query = query.filter(Zayavka.created_at >= created_from)
+    if created_to:
+        query = query.filter(Zayavka.created_at < created_to)
+    if status:
+        query = query.filter(Zayavka.status == status)
+    if type_:
+        query = query.filter(Zayavka.type == type_)
+    if updated_since:
+        # Backfilled values have no microseconds (see paginate); the shorter text form
+        # sorts first, so comparing against it keeps rows from that very second
+        text = updated_since.strftime('%Y-%m-%d %H:%M:%S')
+        if updated_since.microsecond:
+            text += updated_since.strftime('.%f')
+        query = query.filter(db.type_coerce(Zayavka.updated_at, db.String) >= text) \
+            .order_by(Zayavka.updated_at, Zayavka.id)
+    else:
+        query = query.order_by(Zayavka.id)
+    return query.yield_per(STREAM_BATCH)
+
+def calendar_rows(start=None, end=None):
+    # /api/calendar_events: plain (id, type, status, created_at) tuples, no entities at all
+    query = db.session.query(Zayavka.id, Zayavka.type, Zayavka.status, Zayavka.created_at)
+    if start:
+        query = query.filter(Zayavka.created_at >= start)
+    if end:
+        query = query.filter(Zayavka.created_at < end)
+    return query.order_by(Zayavka.created_at)
+
+STATS_DIMENSIONS = ('type', 'status', 'faculty', 'urgent')
+
+def stats(period='month', start=None, end=None, group_by=(), filters=None):
+    """(bucket, *group_by, count, rating_sum, rating_count) rows from request_rollup only.
+
+    start and end are inclusive bucket dates; filters maps dimensions to exact values.
+    """
+    dimensions = [getattr(RequestRollup, name) for name in group_by]
+    query = db.session.query(
+        RequestRollup.bucket, *dimensions, db.func.sum(RequestRollup.count),
+        db.func.sum(RequestRollup.rating_sum), db.func.sum(RequestRollup.rating_count)
+    ).filter(RequestRollup.period == period)
+    if start:
+        query = query.filter(RequestRollup.bucket >= start)
+    if end:
+        query = query.filter(RequestRollup.bucket <= end)
+    for name, value in (filters or {}).items():
+        query = query.filter(getattr(RequestRollup, name) == value)
+    return query.group_by(RequestRollup.bucket, *dimensions) \
+        .having(db.func.sum(RequestRollup.count) > 0).order_by(RequestRollup.bucket, *dimensions)
+
+def newest_first(query):
+    # Matches the (…, created_at) indexes; id breaks ties for keyset pagination
+    return query.order_by(Zayavka.created_at.desc(), Zayavka.id.desc())
+
+def search(query, text):
+    """Restrict an admin listing to `text`.
+
+    Returns (query, rank); rank is the bm25 column when the FTS5 index is
+    used and None for the LIKE fallback.
+    """
+    if search_index_available():
+        if not fts_match_expression(text):
+            return query.filter(db.false()), None
+        fts = search_subquery(text)
+        return query.join(fts, fts.c.id == Zayavka.id), fts.c.rank
+    return query.filter(
+        (Zayavka.description.ilike(f"%{text}%")) |
+        (User.username.ilike(f"%{text}%")) |
+        (User.full_name.ilike(f"%{text}%"))
+    ), None
+
+def encode_cursor(z):
+    # Cursor is the last row's (created_at, id), in the same text form SQLite stores
+    return f"{z.created_at.strftime('%Y-%m-%d %H:%M:%S.%f')}_{z.id}"
+
+def decode_cursor(value):
+    created_at, _, request_id = (value or '').rpartition('_')
+    try:
+        return datetime.fromisoformat(created_at), int(request_id)
+    except ValueError:
+        return None
+
+def paginate(query):
+    """Keyset pagination on (created_at, id) DESC.
+
+    Returns (rows, next_cursor); each page is one index range scan no matter
+    how deep the cursor is.
+    """
+    page_size = current_app.config['PAGE_SIZE']
+    cursor = decode_cursor(request.args.get('cursor'))
+    if cursor:
+        created_at, request_id = cursor
+        query = query.filter(
+            (Zayavka.created_at < created_at) |
+            ((Zayavka.created_at == created_at) & (Zayavka.id < request_id))
+        )
+    rows = newest_first(query).limit(page_size + 1).all()
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+def decode_rank_cursor(value):
+    rank, _, request_id = (value or '').rpartition('_')
+    try:
+        return float(rank), int(request_id)
+    except ValueError:
+        return None
+
+def paginate_ranked(query, rank):
+    # Same idea as paginate(), keyed on (rank, id) ASC for relevance-ordered search results
+    page_size = current_app.config['PAGE_SIZE']
+    cursor = decode_rank_cursor(request.args.get('cursor'))
+    if cursor:
+        last_rank, request_id = cursor
+        query = query.filter((rank > last_rank) | ((rank == last_rank) & (Zayavka.id > request_id)))
+    rows = query.add_columns(rank).order_by(rank, Zayavka.id).limit(page_size + 1).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        last, last_rank = rows[page_size - 1]
+        next_cursor = f"{last_rank!r}_{last.id}"
+    return [z for z, _ in rows[:page_size]], next_cursor
+
+_search_index = {}
+
+def search_index_available():
+    # zayavka_fts is only created by the migration where SQLite is built with FTS5
+    if 'available' not in _search_index:
+        _search_index['available'] = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'zayavka_fts'"
+        )).first() is not None
+    return _search_index['available']
+
+def fts_match_expression(text):
+    # Every word becomes a quoted prefix term, so user input can't inject FTS syntax
+    text = text.replace('ё', 'е').replace('Ё', 'Е')
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+def search_subquery(text):
+    # Description matches count once, name matches twice
+    return db.text(
+        "SELECT rowid AS id, bm25(zayavka_fts, 1.0, 2.0, 2.0) AS rank "
+        "FROM zayavka_fts WHERE zayavka_fts MATCH :match"
+    ).bindparams(match=fts_match_expression(text)).columns(id=db.Integer, rank=db.Float).subquery('fts')
+
+def audited_queries():
+    """Representative query for each route, with sample parameters, for `flask db-audit`.
+
+    Yields (name, query, full_scan_expected).
+    """
+    page_size = current_app.config['PAGE_SIZE']
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    sample_user_id = db.session.query(db.func.min(User.id)).scalar() or 1
+
+    yield '/admin, /api/requests', newest_first(admin_queue()).limit(page_size), False
+    yield '/admin?status=ожидает', newest_first(admin_queue(status_filter='ожидает')).limit(page_size), False
+    yield '/admin?type=Ремонт', newest_first(admin_queue(type_filter='Ремонт')).limit(page_size), False
+    if search_index_available():
+        query, rank = search(admin_queue(), 'принтер')
+        yield '/admin?query=принтер', query.order_by(rank, Zayavka.id).limit(page_size), False
+    yield '/history', newest_first(completed_requests()).limit(page_size), False
+    yield '/my-requests', newest_first(user_requests(sample_user_id)).limit(page_size), False
+    yield '/api/calendar_events', calendar_rows(month_start), False
+    yield '/generate_report (month)', report_table(month_start, month_start.replace(day=28)), False
+    yield '/api/stats?group_by=type', stats('month', group_by=['type']), False
+    yield '/export_requests', export_table(), True
+    yield '/export/requests.csv?updated_since=', integration_rows(updated_since=month_start), False
+
+@contextmanager
+def count_statements():
+    """Collect the SQL statements executed inside the block.
+
+        with count_statements() as statements:
+            client.get('/admin')
+        assert len(statements) <= 2, statements
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,78 @@
+"""Disk cache for generated report files.
+
+A file is named after two hashes: one of what was asked for (format, period,
+filters) and one of the data it was built from (queries.report_version for
+that period). A repeat download of an unchanged month is a file lookup plus
+one index-only query. Any change to a request inside the period changes the
+version and so the name. Storing the new file deletes the older versions of
+the same report, and the least recently served files are evicted once the
+folder grows past REPORT_CACHE_MAX_BYTES.
+
+Misses for the same report are built once: the first request takes a lock
+per report and the others wait for it and then find the file. `flask reports
+pregenerate` fills the cache ahead of time for the previous month.
+"""
+import hashlib
+import json
+import os
+
+from flask import current_app
+
+from archive import file_lock
+import queries
+from utils import atomic_path, evict_lru, remove_file
+
+def digest(value, length):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:length]
+
+def cache_path(format, start, end, filters=None):
+    params = digest({'format': format, 'start': start, 'end': end, 'filters': filters or {}}, 32)
+    version = digest(queries.report_version(start, end), 16)
+    return os.path.join(current_app.config['REPORT_CACHE_FOLDER'], f'{params}-{version}.{format}')
+
+def cached(format, start, end, write, filters=None):
+    """Return (path, hit) for a report, calling write(path) to build it on a miss.
+
+    write must produce the complete file at the path it is given; it gets a
+    temporary name, so concurrent readers never see a half-written report.
+    """
+    path = cache_path(format, start, end, filters)
+    if os.path.exists(path):
+        os.utime(path)  # Most recently used, for evict_lru
+        return path, True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path.rsplit('-', 1)[0]):
+        if os.path.exists(path):
+            return path, True  # Built by whoever held the lock
+        with atomic_path(path) as partial:
+            write(partial)
+    invalidate(path)
+    evict(keep=path)
+    return path, False
+
+def is_report(entry):
+    return entry.is_file() and not entry.name.endswith(('.part', '.lock'))
+
+def invalidate(path):
+    # Older versions of the same report can never be hit again
+    folder, name = os.path.split(path)
+    params = name.split('-', 1)[0]
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(params + '-') and entry.path != path and is_report(entry):
+                remove_file(entry.path)
+
+def evict(keep=None):
+    """Delete least recently used files until the cache fits REPORT_CACHE_MAX_BYTES."""
+    with os.scandir(current_app.config['REPORT_CACHE_FOLDER']) as entries:
+        evict_lru(filter(is_report, entries), current_app.config['REPORT_CACHE_MAX_BYTES'], keep)
+
+def clear():
+    folder = current_app.config['REPORT_CACHE_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if is_report(entry):
+                remove_file(entry.path)
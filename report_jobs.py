@@ -0,0 +1,196 @@
+"""Background report generation.
+
+A full-year report can take longer than a gunicorn worker timeout, so
+/reports/jobs only records a ReportJob row and hands the work to a small
+thread pool; the browser then polls the job and downloads the finished file.
+
+Job state is kept in SQLite, not in the pool, so status and download work
+from any worker process. Each job records the process that queued it
+(owner). Once that process is gone, e.g. after a restart, its queued and
+running jobs are reported as failed when polled and marked failed when
+the next pool starts. A running job whose heartbeat (updated_at) stops
+moving fails as well.
+
+Month-end reports can also be built ahead of time from cron with `flask
+reports pregenerate`; /generate_report and jobs then find them in report_cache.
+"""
+import datetime
+import json
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+
+from models import db, ReportJob
+import exports
+import queries
+import report_cache
+from utils import generate_word_report, generate_pdf_report
+
+# format -> writer(rows, output); every writer takes queries.report_table() rows
+FORMATS = {
+    'xlsx': exports.report_xlsx,
+    'docx': generate_word_report,
+    'pdf': generate_pdf_report,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_process_token = uuid.uuid4().hex[:8]  # Tells this process from a later one that got the same pid
+LOST_ERROR = 'Процесс, формировавший отчёт, был перезапущен'
+
+def report_period(month, year=None):
+    # (start, end) for a month number, or the whole year for 'all'
+    year = year or datetime.date.today().year
+    if month == 'all':
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    month = int(month)
+    return datetime.date(year, month, 1), datetime.date(year + (month == 12), month % 12 + 1, 1)
+
+def report_filename(month, year=None, extension='xlsx'):
+    year = year or datetime.date.today().year
+    if month == 'all':
+        return f"Заявки_{year}.{extension}"
+    month_name = datetime.date(year, int(month), 1).strftime('%B')
+    return f"Заявки_{month_name}_{year}.{extension}"
+
+def previous_month(today=None):
+    first = (today or datetime.date.today()).replace(day=1)
+    last_month = first - datetime.timedelta(days=1)
+    return last_month.month, last_month.year
+
+def build(format, month, year=None, rows=None):
+    """(path, hit) for a report in report_cache, generating it on a miss.
+
+    rows wraps the report_table() query, e.g. to count progress.
+    """
+    start, end = report_period(month, year)
+    wrap = rows or (lambda query: query)
+    write = lambda output: FORMATS[format](wrap(queries.report_table(start, end)), output=output)
+    return report_cache.cached(format, start, end, write)
+
+def pregenerate(month, year, formats=None):
+    # [(format, path, hit)]; an unchanged month costs one version query per format
+    return [(format, *build(format, month, year)) for format in formats or FORMATS]
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            fail_lost()
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['REPORT_WORKERS'], thread_name_prefix='report'
+            )
+        return _executor
+
+def process_owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{_process_token}'
+
+def owner_alive(owner):
+    # Only processes on this host can be checked; anything else counts as alive
+    host, pid, token = owner.rsplit(':', 2)
+    if host != socket.gethostname() or os.name == 'nt':  # On Windows, signal 0 is CTRL_C_EVENT
+        return True
+    if int(pid) == os.getpid():
+        return token == _process_token
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by someone else
+    return True
+
+def is_lost(job):
+    return job.status in ('queued', 'running') and job.owner is not None and not owner_alive(job.owner)
+
+def fail_lost():
+    # Jobs left queued or running by a process that no longer exists
+    jobs = ReportJob.query.filter(ReportJob.status.in_(('queued', 'running')), ReportJob.owner.isnot(None))
+    lost = [job.id for job in jobs if not owner_alive(job.owner)]
+    if lost:
+        ReportJob.query.filter(ReportJob.id.in_(lost)).update(
+            {'status': 'failed', 'error': LOST_ERROR}, synchronize_session=False
+        )
+        db.session.commit()
+        current_app.logger.warning('Report jobs lost in a restart: %s', ', '.join(lost))
+
+def submit(user_id, month, year=None, format='xlsx'):
+    """Queue a report and return its ReportJob; the caller does not need to commit."""
+    year = year or datetime.date.today().year
+    job = ReportJob(
+        id=uuid.uuid4().hex, user_id=user_id, format=format,
+        params=json.dumps({'month': month, 'year': year}),
+        filename=report_filename(month, year, format), owner=process_owner(),
+    )
+    db.session.add(job)
+    prune()
+    db.session.commit()
+    executor().submit(run, current_app._get_current_object(), job.id)
+    return job
+
+def update(job_id, **values):
+    # Progress goes through its own short transaction: the job's session is busy
+    # streaming rows, and committing there would end the read mid-way.
+    values['updated_at'] = datetime.datetime.utcnow()
+    with db.engine.begin() as connection:
+        connection.execute(ReportJob.__table__.update().where(ReportJob.id == job_id).values(**values))
+
+def counted(rows, job_id, every=queries.STREAM_BATCH):
+    for count, row in enumerate(rows, 1):
+        yield row
+        if count % every == 0:
+            update(job_id, progress=count)
+
+def run(app, job_id):
+    with app.app_context():
+        try:
+            job = db.session.get(ReportJob, job_id)
+            params = json.loads(job.params)
+            start, end = report_period(params['month'], params['year'])
+            update(job_id, status='running', total=queries.report_table(start, end).order_by(None).count())
+
+            path, hit = build(job.format, params['month'], params['year'], rows=lambda rows: counted(rows, job_id))
+            update(job_id, status='done', path=path, progress=ReportJob.total)
+            app.logger.info('Report job %s finished: %s%s', job_id, path, ' (cached)' if hit else '')
+        except Exception as exc:
+            app.logger.exception('Report job %s failed', job_id)
+            update(job_id, status='failed', error=str(exc))
+        finally:
+            db.session.remove()
+
+def is_stale(job):
+    # Only running jobs have a heartbeat; queued ones may just be waiting behind long reports
+    if is_lost(job):
+        return True
+    if job.status == 'running':
+        timeout = current_app.config['REPORT_JOB_STALE_SECONDS']
+    elif job.status == 'queued':
+        timeout = current_app.config['REPORT_JOB_QUEUED_TIMEOUT_SECONDS']
+    else:
+        return False
+    if timeout is None:
+        return False
+    return job.updated_at < datetime.datetime.utcnow() - datetime.timedelta(seconds=timeout)
+
+def prune():
+    # Forget old jobs; their files belong to report_cache, which evicts them on its own
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=current_app.config['REPORT_JOB_RETENTION_HOURS'])
+    ReportJob.query.filter(ReportJob.created_at < cutoff).delete(synchronize_session=False)
+
+def job_json(job):
+    stale = is_stale(job)
+    data = {
+        'id': job.id,
+        'status': 'failed' if stale else job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'filename': job.filename,
+        'error': LOST_ERROR if stale else job.error,
+    }
+    if job.status == 'done':
+        data['download_url'] = url_for('report_job_download', job_id=job.id)
+    return data
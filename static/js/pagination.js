@@ -0,0 +1,42 @@
+// "Load more" / infinite scroll for keyset-paginated card lists
+document.addEventListener('DOMContentLoaded', () => {
+    const button = document.getElementById('load-more');
+    const list = document.getElementById('request-list');
+    if (!button || !list) return;
+
+    let loading = false;
+
+    function loadMore() {
+        const cursor = button.dataset.nextCursor;
+        if (loading || !cursor) return;
+        loading = true;
+
+        const params = new URLSearchParams(window.location.search);
+        params.set('cursor', cursor);
+        params.set('partial', '1');
+
+        let nextCursor = null;
+        fetch(`${window.location.pathname}?${params}`)
+            .then(response => {
+                nextCursor = response.headers.get('X-Next-Cursor');
+                return response.text();
+            })
+            .then(html => {
+                list.insertAdjacentHTML('beforeend', html);
+                // Hidden rather than removed: the admin filters can bring it back
+                button.dataset.nextCursor = nextCursor || '';
+                button.hidden = !nextCursor;
+            })
+            .catch(error => console.error('Error:', error))
+            .finally(() => { loading = false; });
+    }
+
+    button.addEventListener('click', loadMore);
+
+    // Load the next page as soon as the button scrolls into view
+    if ('IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadMore();
+        }).observe(button);
+    }
+});
@@ -1,7 +1,122 @@
-console.log("Reporting.js loaded successfully");
+// Reports are built in the background: submit a job, poll its progress, then download.
+// Without JavaScript the form still posts to /generate_report and downloads directly.
+document.addEventListener('DOMContentLoaded', () => {
+    const form = document.getElementById('report-form');
+    if (!form) return;
 
-// Example function for handling report generation
-function generateReport() {
-    console.log("Generating report...");
-    // Add your report generation logic here
-}
+    const box = document.getElementById('report-progress');
+    const bar = box.querySelector('progress');
+    const text = box.querySelector('.report-progress-text');
+    const button = form.querySelector('button[type="submit"]');
+    const POLL_INTERVAL = 1000;
+
+    function show(job) {
+        box.hidden = false;
+        if (job.status === 'queued') {
+            bar.removeAttribute('value');
+            text.textContent = 'Отчёт в очереди...';
+        } else if (job.status === 'running') {
+            if (job.total) {
+                bar.value = Math.round(job.progress * 100 / job.total);
+                text.textContent = `Обработано ${job.progress} из ${job.total} заявок`;
+            } else {
+                bar.removeAttribute('value');
+                text.textContent = 'Формирование отчёта...';
+            }
+        } else if (job.status === 'done') {
+            bar.value = 100;
+            text.textContent = 'Отчёт готов';
+        } else {
+            text.textContent = 'Не удалось сформировать отчёт' + (job.error ? `: ${job.error}` : '');
+        }
+    }
+
+    async function poll(url) {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error(response.statusText);
+        const job = await response.json();
+        show(job);
+        if (job.status === 'done') {
+            window.location = job.download_url;
+        } else if (job.status !== 'failed') {
+            setTimeout(() => poll(url).catch(fail), POLL_INTERVAL);
+            return;
+        }
+        button.disabled = false;
+    }
+
+    function fail(error) {
+        console.error('Report job failed:', error);
+        show({ status: 'failed' });
+        button.disabled = false;
+    }
+
+    form.addEventListener('submit', async (event) => {
+        event.preventDefault();
+        button.disabled = true;
+        try {
+            const response = await fetch(form.dataset.jobsUrl, { method: 'POST', body: new FormData(form) });
+            if (!response.ok) throw new Error(response.statusText);
+            const job = await response.json();
+            show(job);
+            await poll(`${form.dataset.jobsUrl}/${job.id}`);
+        } catch (error) {
+            fail(error);
+        }
+    });
+});
+
+// "Сервисные показатели": resolution-time percentiles and rating histograms from /api/analytics
+document.addEventListener('DOMContentLoaded', () => {
+    const container = document.getElementById('analytics');
+    if (!container) return;
+
+    const LABELS = { type: 'Тип', faculty: 'Факультет' };
+
+    function table(caption, headers, rows) {
+        const element = document.createElement('table');
+        element.className = 'analytics-table';
+        element.createCaption().textContent = caption;
+        const head = element.createTHead().insertRow();
+        headers.forEach(text => { head.insertCell().textContent = text; });
+        const body = element.createTBody();
+        rows.forEach(values => {
+            const row = body.insertRow();
+            values.forEach(value => { row.insertCell().textContent = value ?? '—'; });
+        });
+        return element;
+    }
+
+    function render(data) {
+        container.replaceChildren();
+        const resolution = data.resolution_hours;
+        const overall = resolution.overall;
+        container.append(table('Время до закрытия заявки, часы', ['', 'Заявок', 'p50', 'p90', 'p99'],
+            [['Все', overall.count, overall.p50, overall.p90, overall.p99]]));
+        ['type', 'faculty'].forEach(column => {
+            container.append(table(`Время до закрытия по полю «${LABELS[column]}», часы`,
+                [LABELS[column], 'Заявок', 'p50', 'p90', 'p99'],
+                resolution[`by_${column}`].map(row => [row[column] || '—', row.count, row.p50, row.p90, row.p99])));
+        });
+
+        const ratings = data.ratings;
+        const scale = ratings.scale.map(String);
+        container.append(table('Оценки', ['', ...scale, 'Средняя'],
+            [['Все', ...ratings.overall.histogram, ratings.overall.average]]));
+        ['type', 'faculty'].forEach(column => {
+            container.append(table(`Оценки по полю «${LABELS[column]}»`, [LABELS[column], ...scale, 'Средняя'],
+                ratings[`by_${column}`].map(row => [row[column] || '—', ...row.histogram, row.average])));
+        });
+    }
+
+    fetch(container.dataset.url)
+        .then(response => {
+            if (!response.ok) throw new Error(response.statusText);
+            return response.json();
+        })
+        .then(render)
+        .catch(error => {
+            console.error('Analytics failed to load:', error);
+            container.querySelector('.analytics-status').textContent = 'Не удалось загрузить показатели';
+        });
+});
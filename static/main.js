@@ -15,56 +15,6 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
 
-    // Real-Time Filtering
-    const filterType = document.getElementById('filter-type');
-    const filterStatus = document.getElementById('filter-status');
-    const filterQuery = document.getElementById('filter-query');
-    const requestList = document.getElementById('request-list');
-    const applyFiltersButton = document.getElementById('apply-filters');
-    const noRequests = document.getElementById('no-requests');
-
-    if (filterType && filterStatus && filterQuery && requestList && applyFiltersButton) {
-        function applyFilters(event) {
-            const isButtonClick = event?.target === applyFiltersButton;
-
-            // Get filter values
-            const type = filterType.value.trim().toLowerCase();
-            const status = filterStatus.value.trim().toLowerCase();
-            const query = isButtonClick ? filterQuery.value.trim().toLowerCase() : '';
-
-            const cards = requestList.querySelectorAll('.card');
-            let hasVisibleCards = false;
-
-            cards.forEach(card => {
-                const cardType = card.getAttribute('data-type').trim().toLowerCase();
-                const cardStatus = card.getAttribute('data-status').trim().toLowerCase();
-                const cardDescription = card.getAttribute('data-description').trim().toLowerCase();
-                const cardUsername = card.getAttribute('data-username').trim().toLowerCase();
-                const cardFullName = card.getAttribute('data-fullname').trim().toLowerCase();
-
-                // Check if the card matches the filters
-                const matchesType = !type || cardType === type;
-                const matchesStatus = !status || cardStatus === status;
-                const matchesQuery = !isButtonClick || cardDescription.includes(query) || cardUsername.includes(query) || cardFullName.includes(query);
-
-                if (matchesType && matchesStatus && matchesQuery) {
-                    card.style.display = 'block';
-                    hasVisibleCards = true;
-                } else {
-                    card.style.display = 'none';
-                }
-            });
-
-            // Show or hide the placeholder message
-            noRequests.style.display = hasVisibleCards ? 'none' : 'block';
-        }
-
-        // Attach event listeners
-        filterType.addEventListener('change', applyFilters); // Filter immediately on type change
-        filterStatus.addEventListener('change', applyFilters); // Filter immediately on status change
-        applyFiltersButton.addEventListener('click', applyFilters); // Filter on button click for search query
-    }
-
     // Handle user deletion
     document.querySelectorAll('.delete-user-btn').forEach(button => {
         button.addEventListener('click', (event) => {
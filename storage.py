@@ -0,0 +1,201 @@
+"""Content-addressed storage for uploaded files (attachments and profile photos).
+
+An upload is streamed to a temporary file in fixed-size chunks while it is
+received and hashed, then renamed to UPLOAD_FOLDER/ab/cd/<sha256>. If that blob already
+exists the copy is dropped, so the same screenshot attached ten times is
+stored once. Zayavka.file and User.photo hold "<sha256>.<ext>"; the
+extension only drives the Content-Type when the file is served. The name the
+attachment was uploaded under is kept in Zayavka.file_name and offered as
+the download's file name. Blob records each stored hash.
+
+The extension comes from the uploader, so /uploads only serves names that a
+request or a profile actually stores (no "<sha256>.html" for an uploaded
+.png), always with nosniff, and anything but images and PDFs as an
+attachment rather than inline.
+
+Names from before this scheme ("c3b7862aeec7573b_screen.png") still point at
+flat files in UPLOAD_FOLDER until `flask uploads import` moves them in.
+
+A stored name never changes content, so /uploads serves it with the hash as a
+strong ETag and a one-year immutable Cache-Control. Range requests are
+answered in place, or the bytes are left to the front proxy with
+UPLOADS_SENDFILE ('x-sendfile' for Apache/lighttpd, 'x-accel-redirect' for
+nginx, with an internal location aliasing UPLOAD_FOLDER at
+UPLOADS_ACCEL_PREFIX).
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from urllib.parse import quote
+
+from flask import Request, current_app, request
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename, send_file
+
+from models import db, Blob, User, Zayavka
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+NAME = re.compile(r'([0-9a-f]{64})(\.[0-9a-z]{1,10})?')
+LEGACY_NAME = re.compile(r'[0-9a-f]{16}_.+')
+INLINE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.pdf'}  # No .svg: it can carry script
+
+def content_hash(name):
+    # The sha256 behind a stored name, or None for a legacy flat file name
+    match = NAME.fullmatch(name or '')
+    return match.group(1) if match else None
+
+def blob_path(sha256):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], sha256[:2], sha256[2:4], sha256)
+
+def file_path(name):
+    sha256 = content_hash(name)
+    return blob_path(sha256) if sha256 else os.path.join(current_app.config['UPLOAD_FOLDER'], name)
+
+def download_name(name):
+    """File name to offer for a stored name, or None unless a request or a profile stores it (extension included)."""
+    row = db.session.query(Zayavka.file_name).filter_by(file=name).order_by(Zayavka.id.desc()).first()
+    if row:
+        return row.file_name or name
+    return name if db.session.query(User.id).filter_by(photo=name).first() else None
+
+def original_name(filename):
+    # What the browser sent, minus any client-side directories; kept for display and download only
+    return os.path.basename((filename or '').replace('\\', '/'))[:200] or None
+
+def response(name):
+    """The /uploads/<name> response: conditional, range-aware, optionally sent by the proxy."""
+    sha256 = content_hash(name)
+    folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    path = blob_path(sha256) if sha256 else safe_join(folder, name)
+    offered = download_name(name) if path and os.path.isfile(path) else None
+    if not offered:
+        raise NotFound()
+    mode = current_app.config['UPLOADS_SENDFILE']
+    environ = request.environ
+    if mode:
+        # The proxy answers Range itself; from here it only needs the headers (or a 304)
+        environ = {key: value for key, value in environ.items() if key != 'HTTP_RANGE'}
+    rv = send_file(
+        os.path.abspath(path), environ, download_name=offered, etag=sha256 or True,
+        mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',  # Never from the uploader's name
+        as_attachment=os.path.splitext(name)[1].lower() not in INLINE_EXTENSIONS,
+        max_age=IMMUTABLE_MAX_AGE if sha256 else current_app.config['UPLOADS_MAX_AGE'],
+        use_x_sendfile=bool(mode), response_class=current_app.response_class,
+    )
+    rv.headers['X-Content-Type-Options'] = 'nosniff'
+    if sha256:
+        rv.cache_control.immutable = True
+    if mode == 'x-accel-redirect' and 'X-Sendfile' in rv.headers:
+        relative = os.path.relpath(rv.headers.pop('X-Sendfile'), folder).replace(os.sep, '/')
+        rv.headers['X-Accel-Redirect'] = current_app.config['UPLOADS_ACCEL_PREFIX'] + quote(relative)
+    return rv
+
+def extension(filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return ext if NAME.fullmatch('0' * 64 + ext) else ''
+
+class SpooledUpload:
+    """Temporary file in UPLOAD_FOLDER/tmp that hashes what is written to it.
+
+    Multipart file parts are parsed straight into one of these (UploadRequest),
+    so by the time the view runs the upload is on disk, its hash is known and
+    storing it is a rename on the same filesystem. Unless keep() moved it, the
+    file is deleted when werkzeug closes it at the end of the request.
+    """
+
+    def __init__(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=folder, suffix='.part', delete=False)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.kept = False
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def keep(self):
+        """Move the file into the blob store (or drop it if the blob exists); returns (sha256, size)."""
+        self.file.flush()
+        sha256 = self.digest.hexdigest()
+        path = blob_path(sha256)
+        if os.path.exists(path):
+            os.utime(path)  # Fresh again, so `flask uploads gc` leaves it alone until we commit
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.file.name, path)
+            self.kept = True
+        return sha256, self.size
+
+    def close(self):
+        self.file.close()
+        if not self.kept and os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+def spool():
+    return SpooledUpload(os.path.join(current_app.config['UPLOAD_FOLDER'], 'tmp'))
+
+class UploadRequest(Request):
+    # Writes file parts into SpooledUpload in the parser's chunks, instead of werkzeug's
+    # in-memory buffer for small parts and anonymous temporary files for large ones
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return spool()
+
+def write(stream):
+    """Copy a binary stream into the blob store; returns (sha256, size)."""
+    spooled = spool()
+    try:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            spooled.write(chunk)
+        return spooled.keep()
+    finally:
+        spooled.close()
+
+def store(upload):
+    """Save a werkzeug FileStorage and return the name to keep in the model; the caller commits."""
+    if isinstance(upload.stream, SpooledUpload):
+        sha256, size = upload.stream.keep()
+    else:
+        sha256, size = write(upload.stream)
+    Blob.record(sha256, size)
+    return sha256 + extension(upload.filename)
+
+def import_legacy():
+    """Move flat files referenced by Zayavka.file / User.photo into the blob store.
+
+    Returns (files imported, references rewritten). Unreferenced flat files are left alone.
+    """
+    names = {name for (name,) in db.session.query(Zayavka.file).filter(Zayavka.file.isnot(None)).distinct()}
+    names |= {name for (name,) in db.session.query(User.photo).filter(User.photo.isnot(None)).distinct()}
+    imported = rewritten = 0
+    for name in sorted(names):
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], name)
+        if content_hash(name) or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as source:
+            sha256, size = write(source)
+        new_name = sha256 + extension(name)
+        # Legacy names were "<16 hex>_<secure_filename(original)>"
+        legacy_original = name.split('_', 1)[1] if LEGACY_NAME.fullmatch(name) else name
+        count = Zayavka.query.filter_by(file=name).update(
+            {'file': new_name, 'file_name': db.func.coalesce(Zayavka.file_name, legacy_original)},
+            synchronize_session=False,
+        )
+        count += User.query.filter_by(photo=name).update({'photo': new_name}, synchronize_session=False)
+        Blob.record(sha256, size)
+        db.session.commit()
+        os.remove(path)
+        imported += 1
+        rewritten += count
+    return imported, rewritten
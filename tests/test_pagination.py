@@ -0,0 +1,73 @@
+import importlib.util
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from app import app
+from models import db, User, Zayavka
+from queries import paginate, user_requests
+
+def run_migration(name):
+    spec = importlib.util.spec_from_file_location(name, ROOT / 'migrations' / 'versions' / f'{name}.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with db.engine.begin() as connection, Operations.context(MigrationContext.configure(connection)):
+        module.upgrade()
+
+def setup_module():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='emp', email='emp@example.com', password='x', role='employee')
+        db.session.add(user)
+        db.session.commit()
+        # Rows from the old func.now() default ("10:00:05") next to ones written from
+        # Python ("10:00:05.000000", "10:00:05.500000") within the same seconds
+        for i in range(1, 68):
+            fraction = ('', '.000000', '.500000')[i % 3]
+            db.session.execute(db.text(
+                "INSERT INTO zayavka (id, type, description, status, created_at, user_id) "
+                "VALUES (:id, 'Ремонт', 'x', 'ожидает', :created_at, :user_id)"
+            ), {'id': i, 'created_at': f'2025-04-01 10:00:{i // 6:02d}{fraction}', 'user_id': user.id})
+        db.session.commit()
+        run_migration('d8b1f3c6a724_normalize_zayavka_created_at')
+
+def pages(page_size):
+    app.config['PAGE_SIZE'] = page_size
+    ids, cursor = [], None
+    with app.app_context():
+        user_id = User.query.filter_by(username='emp').one().id
+        for _ in range(100):  # A cursor that doesn't advance would loop forever
+            with app.test_request_context(query_string={'cursor': cursor} if cursor else None):
+                rows, cursor = paginate(user_requests(user_id))
+            ids.extend(z.id for z in rows)
+            if not cursor:
+                break
+    return ids
+
+def test_pages_cover_every_row_once():
+    for page_size in (1, 7, 30):
+        ids = pages(page_size)
+        assert len(ids) == 67 and set(ids) == set(range(1, 68))
+
+def test_pages_are_newest_first():
+    with app.app_context():
+        created = {z.id: z.created_at for z in Zayavka.query}
+    keys = [(created[i], i) for i in pages(7)]
+    assert keys == sorted(keys, reverse=True)
+
+def test_new_rows_are_stored_with_microseconds():
+    with app.app_context():
+        user_id = User.query.filter_by(username='emp').one().id
+        db.session.add(Zayavka(type='Ремонт', description='x', user_id=user_id))
+        db.session.commit()
+        stored = db.session.execute(db.text('SELECT created_at FROM zayavka ORDER BY id DESC LIMIT 1')).scalar()
+        assert '.' in stored
@@ -0,0 +1,107 @@
+"""Collection of orphaned uploads (`flask uploads gc`).
+
+A file in UPLOAD_FOLDER is an orphan once nothing names it any more, e.g.
+a deleted request's attachment or a replaced profile photo. Nothing
+deletes files when references go away, so a collector has to. The live
+names are streamed from Zayavka.file and User.photo, and the upload tree is
+walked with os.scandir. Files that are unreferenced and older than the
+grace period are moved to UPLOAD_QUARANTINE_FOLDER/orphans, or deleted.
+Three kinds qualify: blobs, legacy flat files, and partial uploads left
+in tmp/. The grace period covers uploads whose request has not committed
+yet; storage touches a reused blob for the same reason.
+
+Besides cron, the collector can run every UPLOAD_GC_INTERVAL_HOURS from the
+upload pool (upload_pipeline), at most once per interval across workers.
+"""
+import os
+import shutil
+import time
+
+from flask import current_app
+
+from archive import file_lock
+from models import db, Blob, User, Zayavka
+import media
+import queries
+import storage
+
+def referenced_names():
+    names = set()
+    for column in (Zayavka.file, User.photo):
+        rows = db.session.query(column).filter(column.isnot(None)).distinct().yield_per(queries.STREAM_BATCH)
+        names.update(name for (name,) in rows)
+    return names
+
+def upload_files(folder):
+    # Every regular file under folder, depth first, without following symlinks
+    folders = [folder]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+def is_orphan(relative, names, hashes):
+    folder, name = os.path.split(relative)
+    if folder == 'tmp':
+        return True  # A partial upload whose request is long gone
+    if not folder:
+        # Legacy attachments and photos, next to the archive workbooks and their lock files
+        kept = names | set(current_app.config['ARCHIVE_FILES'].values())
+        return name not in kept and name.removesuffix('.lock') not in kept
+    return storage.content_hash(name) == name and name not in hashes
+
+def dispose(path, relative, quarantine):
+    if not quarantine:
+        os.remove(path)
+        return
+    target = os.path.join(current_app.config['UPLOAD_QUARANTINE_FOLDER'], 'orphans', relative)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(path, target)
+
+def collect(grace_hours=None, quarantine=True, dry_run=False):
+    """Move aside (or delete) orphaned uploads; returns (files, bytes) reclaimed."""
+    if grace_hours is None:
+        grace_hours = current_app.config['UPLOAD_GC_GRACE_HOURS']
+    folder = current_app.config['UPLOAD_FOLDER']
+    names = referenced_names()
+    hashes = {storage.content_hash(name) for name in names} - {None}
+    cutoff = time.time() - grace_hours * 3600
+    files = reclaimed = 0
+    blobs = []
+    for entry in upload_files(folder):
+        stat = entry.stat(follow_symlinks=False)
+        relative = os.path.relpath(entry.path, folder)
+        if stat.st_mtime > cutoff or not is_orphan(relative, names, hashes):
+            continue
+        files += 1
+        reclaimed += stat.st_size
+        if dry_run:
+            continue
+        dispose(entry.path, relative, quarantine)
+        if storage.content_hash(entry.name) == entry.name:
+            blobs.append(entry.name)
+            media.remove(entry.name)
+    for start in range(0, len(blobs), 500):
+        Blob.query.filter(Blob.sha256.in_(blobs[start:start + 500])).delete(synchronize_session=False)
+    db.session.commit()
+    current_app.logger.info(f"Upload GC: {files} orphaned files, {reclaimed} bytes{' (dry run)' if dry_run else ''}")
+    return files, reclaimed
+
+def maybe_collect():
+    # The optional periodic run; a marker file's mtime records the last one
+    interval = current_app.config['UPLOAD_GC_INTERVAL_HOURS']
+    if not interval:
+        return
+    folder = current_app.config['UPLOAD_QUARANTINE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    marker = os.path.join(folder, 'gc.last')
+    with file_lock(marker):
+        if os.path.exists(marker) and os.path.getmtime(marker) > time.time() - interval * 3600:
+            return
+        collect()
+        with open(marker, 'a'):
+            pass
+        os.utime(marker)
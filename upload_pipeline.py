@@ -0,0 +1,85 @@
+"""Work on a new upload that doesn't have to hold up the request.
+
+By the time a view commits, the upload is already in the blob store
+(storage.py). schedule() hands the rest to a small thread pool: the virus
+scan hook, then, for images, the media variants.
+
+UPLOAD_SCANNER is a callable that takes the blob's path and returns None
+for a clean file or a reason string. UPLOAD_SCAN_COMMAND builds one from a
+clamscan-style command. An infected blob is moved to
+UPLOAD_QUARANTINE_FOLDER and every reference to it is cleared.
+"""
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from models import db, Blob, User, Zayavka
+import media
+import storage
+import upload_gc
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def command_scanner(command):
+    """UPLOAD_SCANNER running e.g. "clamdscan --no-summary": exit 0 clean, 1 infected, else an error."""
+    args = shlex.split(command)
+
+    def scan(path):
+        result = subprocess.run([*args, os.path.abspath(path)], capture_output=True, text=True, timeout=300)
+        if result.returncode == 1:
+            return result.stdout.strip() or 'infected'
+        if result.returncode != 0:
+            raise RuntimeError(f"{args[0]} exited with {result.returncode}: {result.stderr.strip()}")
+        return None
+    return scan
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['UPLOAD_WORKERS'], thread_name_prefix='upload'
+            )
+        return _executor
+
+def schedule(name):
+    # Call after the commit that stored name; legacy flat names are left alone
+    sha256 = storage.content_hash(name)
+    if sha256:
+        executor().submit(run, current_app._get_current_object(), sha256, media.image_hash(name) is not None)
+
+def run(app, sha256, image):
+    with app.app_context():
+        try:
+            scanner = app.config['UPLOAD_SCANNER']
+            reason = scanner(storage.blob_path(sha256)) if scanner else None
+            if reason:
+                quarantine(sha256, reason)
+            elif image:
+                media.render_all(sha256)
+            upload_gc.maybe_collect()
+        except Exception:
+            app.logger.exception('Processing upload %s failed', sha256)
+        finally:
+            db.session.remove()
+
+def quarantine(sha256, reason):
+    """Take a blob out of service: drop every reference to it and move the file aside."""
+    Zayavka.query.filter(Zayavka.file.like(sha256 + '%')).update({'file': None}, synchronize_session=False)
+    User.query.filter(User.photo.like(sha256 + '%')).update({'photo': None}, synchronize_session=False)
+    Blob.query.filter_by(sha256=sha256).delete()
+    db.session.commit()
+    folder = current_app.config['UPLOAD_QUARANTINE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    try:
+        shutil.move(storage.blob_path(sha256), os.path.join(folder, sha256))
+    except FileNotFoundError:
+        pass  # Quarantined by another worker
+    media.remove(sha256)
+    current_app.logger.warning(f"Upload {sha256} quarantined: {reason}")
@@ -1,63 +1,230 @@
+import contextlib
+import functools
+import os
+import re
+import tempfile
+import uuid
+from xml.sax.saxutils import escape
+
 from docx import Document
-from io import BytesIO
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, Table, TableStyle
+
+from exports import SPOOL_MAX_SIZE
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """Temporary name next to path, renamed onto it when the block completes.
+
+    Readers see either no file or the complete one; on an exception the
+    partial file is deleted. The ".part" suffix lets folder scans skip it.
+    """
+    partial = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        yield partial
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+def evict_lru(entries, max_bytes, keep=None):
+    """Delete the least recently used files (os.DirEntry) until the rest fit in max_bytes.
+
+    mtime is the LRU clock: caches os.utime() a file whenever they serve it.
+    """
+    files = []
+    for entry in entries:
+        stat = entry.stat()
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path != keep:
+            remove_file(path)
+            total -= size
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # Another worker got there first
 
-def generate_word_report(zayavki):
+WORD_COLUMNS = ('Сотрудник', 'Тип', 'Описание', 'Дата')
+WORD_CHUNK_ROWS = 1000  # Rows parsed into the document per parse_xml call
+XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def word_cell(text):
+    # One <w:tc>; line breaks become <w:br/> like python-docx's cell.text setter does
+    lines = escape(XML_INVALID_CHARS.sub('', text or '')).split('\n')
+    runs = '<w:br/>'.join(f'<w:t xml:space="preserve">{line}</w:t>' for line in lines)
+    return f'<w:tc><w:p><w:r>{runs}</w:r></w:p></w:tc>'
+
+def word_rows(rows):
+    """<w:tr> elements for queries.report_table() rows, WORD_CHUNK_ROWS at a time."""
+    chunk = []
+    for username, type_, description, status, created_at in rows:
+        chunk.append('<w:tr>' + word_cell(username) + word_cell(type_) + word_cell(description)
+                     + word_cell(created_at.strftime('%d.%m.%Y %H:%M') if created_at else '') + '</w:tr>')
+        if len(chunk) == WORD_CHUNK_ROWS:
+            yield from parse_xml(f'<w:tbl {nsdecls("w")}>{"".join(chunk)}</w:tbl>')
+            chunk = []
+    if chunk:
+        yield from parse_xml(f'<w:tbl {nsdecls("w")}>{"".join(chunk)}</w:tbl>')
+
+def generate_word_report(rows, output=None):
+    """Word report of queries.report_table() rows.
+
+    table.add_row() re-walks the table XML on every call, which makes big
+    reports quadratic, so rows are written as XML and parsed in bulk instead.
+    Returns `output`, or a temporary file positioned at the start when none is given.
+    """
     doc = Document()
     doc.add_heading('Отчёт по заявкам', 0)
 
-    # Заголовок таблицы
-    table = doc.add_table(rows=1, cols=4)
+    table = doc.add_table(rows=1, cols=len(WORD_COLUMNS))
     table.style = 'Table Grid'
-    hdr_cells = table.rows[0].cells
-    hdr_cells[0].text = 'Сотрудник'
-    hdr_cells[1].text = 'Тип'
-    hdr_cells[2].text = 'Описание'
-    hdr_cells[3].text = 'Дата'
-
-    # Заполнение таблицы
-    for z in zayavki:
-        row_cells = table.add_row().cells
-        row_cells[0].text = z.user.username
-        row_cells[1].text = z.type
-        row_cells[2].text = z.description
-        row_cells[3].text = z.created_at.strftime('%d.%m.%Y %H:%M')
-
-    # Сохранение в BytesIO
-    byte_io = BytesIO()
-    doc.save(byte_io)
-    byte_io.seek(0)
-    return byte_io
-
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
-
-def generate_pdf_report(zayavki):
-    byte_io = BytesIO()
-    c = canvas.Canvas(byte_io, pagesize=letter)
-    c.setFont("Helvetica", 10)
-
-    # Заголовок
-    c.drawString(100, 750, 'Отчёт по заявкам')
-
-    # Колонки
-    y_position = 730
-    c.drawString(100, y_position, 'Сотрудник')
-    c.drawString(200, y_position, 'Тип')
-    c.drawString(300, y_position, 'Описание')
-    c.drawString(400, y_position, 'Дата')
-
-    # Заполнение таблицы
-    y_position -= 20
-    for z in zayavki:
-        c.drawString(100, y_position, z.user.username)
-        c.drawString(200, y_position, z.type)
-        c.drawString(300, y_position, z.description)
-        c.drawString(400, y_position, z.created_at.strftime('%d.%m.%Y %H:%M'))
-        y_position -= 20
-
-    c.showPage()
-    c.save()
-
-    byte_io.seek(0)
-    return byte_io
+    for cell, title in zip(table.rows[0].cells, WORD_COLUMNS):
+        cell.text = title
+
+    tbl = table._tbl
+    for tr in word_rows(rows):
+        tbl.append(tr)
+
+    if output is not None:
+        doc.save(output)
+        return output
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, suffix='.docx')
+    doc.save(spool)
+    spool.seek(0)
+    return spool
+
+# Helvetica has no Cyrillic glyphs, so reports embed a TTF. reportlab only embeds
+# the glyphs actually used (subsetting), so the font adds a few dozen KB per file.
+PDF_FONT_CANDIDATES = (
+    os.getenv('PDF_FONT_PATH'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'fonts', 'DejaVuSans.ttf'),
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+)
+PDF_COLUMNS = ('Сотрудник', 'Тип', 'Описание', 'Дата')
+PDF_COLUMN_WIDTHS = (35 * mm, 35 * mm, 85 * mm, 27 * mm)
+PDF_CHUNK_ROWS = 50  # Rows per Table flowable; small tables keep page splitting cheap
+PDF_DESCRIPTION_LIMIT = 1500  # A single row must fit on one page; longer descriptions end in "…"
+
+@functools.lru_cache(maxsize=None)
+def pdf_font():
+    """Register the report font once per process and return its name."""
+    for path in PDF_FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            pdfmetrics.registerFont(TTFont('ReportFont', path))
+            return 'ReportFont'
+    # Helvetica has no Cyrillic: the report would come out as black boxes
+    raise RuntimeError('No Cyrillic TTF found for PDF reports (static/fonts/DejaVuSans.ttf is missing), set PDF_FONT_PATH')
+
+class LazyFlowables(list):
+    """Flowable list that is filled from a generator as the document consumes it.
+
+    doc.build() takes a list and pops from its front; topping the list up on
+    every len() keeps only a couple of tables alive instead of the whole report.
+    """
+
+    def __init__(self, flowables, ahead=2):
+        super().__init__()
+        self.flowables = iter(flowables)
+        self.ahead = ahead
+
+    def __len__(self):
+        while super().__len__() < self.ahead:
+            flowable = next(self.flowables, None)
+            if flowable is None:
+                break
+            self.append(flowable)
+        return super().__len__()
+
+def pdf_description(description):
+    description = description or ''
+    if len(description) > PDF_DESCRIPTION_LIMIT:
+        return description[:PDF_DESCRIPTION_LIMIT - 1].rstrip() + '…'
+    return description
+
+def pdf_tables(rows, font, size=8):
+    # Text is wrapped here with simpleSplit and handed to Table as plain multi-line
+    # strings: an order of magnitude cheaper than a Paragraph per cell.
+    table_style = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font),
+        ('FONTSIZE', (0, 0), (-1, -1), size),
+        ('LEADING', (0, 0), (-1, -1), size + 2),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('GRID', (0, 0), (-1, -1), 0.25, '#999999'),
+    ])
+    widths = [column_width - 6 for column_width in PDF_COLUMN_WIDTHS]  # Minus the default cell padding
+    chunk = []
+    for username, type_, description, status, created_at in rows:
+        chunk.append((
+            '\n'.join(simpleSplit(username or '', font, size, widths[0])),
+            '\n'.join(simpleSplit(type_ or '', font, size, widths[1])),
+            '\n'.join(simpleSplit(pdf_description(description), font, size, widths[2])),
+            created_at.strftime('%d.%m.%Y %H:%M') if created_at else '',
+        ))
+        if len(chunk) == PDF_CHUNK_ROWS:
+            yield Table(chunk, colWidths=PDF_COLUMN_WIDTHS, style=table_style)
+            chunk = []
+    if chunk:
+        yield Table(chunk, colWidths=PDF_COLUMN_WIDTHS, style=table_style)
+
+def generate_pdf_report(rows, output=None):
+    """Multi-page PDF of queries.report_table() rows.
+
+    Rows are turned into flowables only as pages are laid out, so only a
+    couple of row tables exist at a time; what still grows with the report is
+    reportlab's buffer of finished pages, about the size of the file itself.
+    Returns `output`, or a temporary file positioned at the start when none is given.
+    """
+    font = pdf_font()
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, suffix='.pdf')
+        rewind = True
+    else:
+        rewind = False
+
+    width, height = A4
+    margin = 15 * mm
+    header_height = 18 * mm
+
+    def draw_page(canvas, doc):
+        # Title and column headings are drawn per page, so the row tables carry no header
+        canvas.saveState()
+        top = height - margin
+        if doc.page == 1:
+            canvas.setFont(font, 14)
+            canvas.drawString(margin, top - 5 * mm, 'Отчёт по заявкам')
+        canvas.setFont(font, 9)
+        x = margin
+        for title, column_width in zip(PDF_COLUMNS, PDF_COLUMN_WIDTHS):
+            canvas.drawString(x + 2, top - header_height + 3 * mm, title)
+            x += column_width
+        canvas.line(margin, top - header_height + 1.5 * mm, x, top - header_height + 1.5 * mm)
+        canvas.setFont(font, 8)
+        canvas.drawRightString(width - margin, margin / 2, f'Стр. {doc.page}')
+        canvas.restoreState()
+
+    doc = BaseDocTemplate(output, pagesize=A4, title='Отчёт по заявкам',
+                          leftMargin=margin, rightMargin=margin, topMargin=margin, bottomMargin=margin)
+    frame = Frame(margin, margin, width - 2 * margin, height - 2 * margin - header_height,
+                  leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+    doc.addPageTemplates([PageTemplate('rows', frames=[frame], onPage=draw_page)])
+    doc.build(LazyFlowables(pdf_tables(rows, font)))
+
+    if rewind:
+        output.seek(0)
+    return output